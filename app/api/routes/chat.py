@@ -1,4 +1,6 @@
-import asyncio
+from datetime import timezone
+
+from cassandra.util import min_uuid_from_time
 from fastapi import (
     APIRouter, 
     Request, 
@@ -6,14 +8,32 @@ from fastapi import (
     status, 
     Depends
 )
+from fastapi.responses import StreamingResponse
 
-from app.db.cassandra import get_cassandra_session
-from app.services.chat import get_user_rooms
+from app.api.responses import FastJSONResponse
+from app.services.chat import get_user_rooms_page, get_room_messages_page
+from app.services.membership import is_room_member
+from app.services.search import search_index
+from app.services.sync import sync_changes
 from app.utils.auth import verify_cookies
-from app.schemas.data_validators import QueryParams, RoomMessagesQueryParams
+from app.utils.cursor import decode_before_cursor, decode_cursor, encode_cursor
+from app.utils.serializers import dumps_bytes
+from app.schemas.data_validators import (
+    QueryParams,
+    RoomMessagesQueryParams,
+    SearchQueryParams,
+    SyncRequest,
+)
 
 router = APIRouter()
-session = get_cassandra_session()
+
+def _decode_offset(cursor):
+    if not cursor:
+        return 0
+    offset = decode_cursor(cursor).get('offset')
+    if not isinstance(offset, int) or offset < 0:
+        raise ValueError('Invalid cursor')
+    return offset
 
 @router.get('/api/chats/rooms')
 async def get_user_chat_rooms(
@@ -23,22 +43,21 @@ async def get_user_chat_rooms(
     try:
         cookies = request.cookies
         await verify_cookies(cookies)
-        rooms = await get_user_rooms(
+        rooms, next_cursor = await get_user_rooms_page(
             team_id=params.team_id, 
             user_id=params.user_id, 
-            cookies=cookies
+            cookies=cookies,
+            limit=params.limit,
+            cursor=decode_cursor(params.cursor) if params.cursor else None,
+            search=params.search,
         )
-        
-        if params.search:
-            search_lower = params.search.lower()
-            rooms = [
-                r for r in rooms if
-                search_lower in (r['participant_name'] or '').lower()
-                or search_lower in (r['last_message'] or '').lower()
-            ]
-
-        paginated_rooms = rooms[params.skip:params.skip+params.limit]
-        return paginated_rooms
+
+        return FastJSONResponse({
+            'rooms': rooms,
+            'count': len(rooms),
+            'next_cursor': encode_cursor(next_cursor) if next_cursor else None,
+            'has_more': next_cursor is not None,
+        })
     except HTTPException as e:
         raise e
     except ValueError as e:
@@ -61,60 +80,68 @@ async def get_room_messages(
         cookies = request.cookies
         await verify_cookies(cookies)
                 
-        room_exist = await asyncio.to_thread(
-            lambda: session.execute(
-                """
-                SELECT room_id FROM user_chats_by_user 
-                WHERE team_id = %s AND room_id = %s AND user_id = %s LIMIT 1
-                """, 
-                (params.team_id, params.room_id, params.user_id)
-            ).one()
-        )
-
-        if not room_exist:
+        if not await is_room_member(params.team_id, params.user_id, params.room_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND, 
                 detail='Room does not exist'
             )
         
-        query = """
-            SELECT message_id, sender_id, receiver_id, 
-                content, message_type, attachment_url, 
-                file_name, file_size, mime_type, timestamp
-            FROM direct_messages
-            WHERE room_id = %s
-        """
-        query_params = [params.room_id]
-
-        if params.before:
-            query += ' AND timestamp < %s'
-            query_params.append(params.before)
-
-        query += ' ORDER BY message_id ASC'
-        rows = await asyncio.to_thread(session.execute, query, query_params)
-
-        messages = []
-
-        for row in rows:
-            message_data = {
-                'message_id': str(row.message_id),
-                'sender_id': str(row.sender_id),
+        if params.search:
+            # Ranked full-text results, paged by offset
+            offset = _decode_offset(params.cursor)
+            results = await search_index.search_room(
+                params.team_id, params.room_id, params.search,
+                params.limit + 1, offset,
+            )
+            has_more = len(results) > params.limit
+            messages = results[:params.limit]
+            return FastJSONResponse({
+                'room_id': params.room_id,
+                'messages': messages,
+                'count': len(messages),
+                'next_cursor': (
+                    encode_cursor({'offset': offset + params.limit}) if has_more else None
+                ),
+                'has_more': has_more,
+            })
+
+        if params.cursor:
+            before_id = decode_before_cursor(params.cursor)
+        elif params.before:
+            before = params.before
+            if before.tzinfo is None:
+                # Naive times are UTC, not the server's local time
+                before = before.replace(tzinfo=timezone.utc)
+            before_id = min_uuid_from_time(before.timestamp())
+        else:
+            before_id = None
+
+        rows, has_more = await get_room_messages_page(
+            params.room_id, params.limit, before_id
+        )
+        next_before = rows[-1].message_id if has_more else None
+
+        # Pages are read newest first but returned in chronological order
+        messages = [
+            {
+                'message_id': row.message_id,
+                'sender_id': row.sender_id,
                 'content': row.content,
-                'timestamp': row.timestamp.isoformat()
+                'timestamp': row.timestamp,
             }
+            for row in reversed(rows)
+        ]
+        next_cursor = (
+            encode_cursor({'before': str(next_before)}) if next_before else None
+        )
 
-            if not params.search or (params.search.lower() in (row.content or '').lower()):
-                messages.append(message_data)
-        
-        paginated_messages = messages[params.skip:params.skip+params.limit]
-
-        return {
+        return FastJSONResponse({
             'room_id': params.room_id,
-            'messages': paginated_messages,
-            'count': len(paginated_messages),
-            'total': len(messages),
-            'has_more': len(messages) > (params.skip + params.limit)
-        }
+            'messages': messages,
+            'count': len(messages),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+        })
     except HTTPException as e:
         raise e
     except ValueError as e:
@@ -127,3 +154,82 @@ async def get_room_messages(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail='Internal Server Error'
         )
+
+@router.get('/api/chats/search')
+async def search_messages(
+    request: Request, 
+    params: SearchQueryParams = Depends()
+):
+    try:
+        cookies = request.cookies
+        await verify_cookies(cookies)
+
+        offset = _decode_offset(params.cursor)
+        if params.room_id:
+            if not await is_room_member(params.team_id, params.user_id, params.room_id):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND, 
+                    detail='Room does not exist'
+                )
+            results = await search_index.search_room(
+                params.team_id, params.room_id, params.q, params.limit + 1, offset
+            )
+        else:
+            results = await search_index.search_user(
+                params.team_id, params.user_id, params.q, params.limit + 1, offset
+            )
+
+        has_more = len(results) > params.limit
+        results = results[:params.limit]
+        return FastJSONResponse({
+            'results': results,
+            'count': len(results),
+            'next_cursor': (
+                encode_cursor({'offset': offset + params.limit}) if has_more else None
+            ),
+            'has_more': has_more,
+        })
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail=str(e)
+        )
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+            detail='Internal Server Error'
+        )
+
+@router.post('/api/chats/sync')
+async def sync_chats(request: Request, params: SyncRequest):
+    try:
+        cookies = request.cookies
+        await verify_cookies(cookies)
+
+        changes = sync_changes(
+            params.team_id, params.user_id, cookies, params.since, params.rooms
+        )
+        # Pull the first chunk here so bad cursors still get a 400
+        first = await anext(changes)
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, 
+            detail=str(e)
+        )
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+            detail='Internal Server Error'
+        )
+
+    async def stream():
+        # One JSON document per line (NDJSON)
+        yield dumps_bytes(first) + b'\n'
+        async for chunk in changes:
+            yield dumps_bytes(chunk) + b'\n'
+
+    return StreamingResponse(stream(), media_type='application/x-ndjson')
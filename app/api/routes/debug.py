@@ -0,0 +1,30 @@
+from fastapi import APIRouter
+
+from app.services.connections import get_connection_stats
+from app.services.ephemeral import get_ephemeral_metrics
+from app.services.rate_limit import get_rate_limit_metrics
+from app.sio_server import manager
+from app.services.write_behind import get_write_behind_metrics
+
+# Only mounted when settings.DEBUG is on
+router = APIRouter()
+
+@router.get('/api/debug/write-behind')
+async def write_behind_metrics():
+    return get_write_behind_metrics()
+
+@router.get('/api/debug/connections')
+async def connection_stats():
+    return get_connection_stats()
+
+@router.get('/api/debug/emit-routing')
+async def emit_routing_metrics():
+    return getattr(manager, 'metrics', {})
+
+@router.get('/api/debug/rate-limits')
+async def rate_limit_metrics():
+    return get_rate_limit_metrics()
+
+@router.get('/api/debug/ephemeral')
+async def ephemeral_metrics():
+    return get_ephemeral_metrics()
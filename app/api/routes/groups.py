@@ -0,0 +1,188 @@
+import uuid
+
+from fastapi import (
+    APIRouter,
+    Request,
+    HTTPException,
+    status,
+    Depends,
+    Path,
+)
+
+from app.api.responses import FastJSONResponse
+from app.services.groups import (
+    add_group_members,
+    create_group,
+    get_group,
+    get_group_messages_page,
+    get_user_groups,
+    leave_group,
+)
+from app.utils.auth import verify_cookies
+from app.utils.cursor import decode_before_cursor, encode_cursor
+from app.utils.logger import get_logger
+from app.schemas.data_validators import (
+    AddGroupMembersRequest,
+    CreateGroupRequest,
+    GroupMessagesQueryParams,
+    GroupQueryParams,
+)
+
+logger = get_logger('groups')
+
+router = APIRouter()
+
+async def _get_member_group(group_id, team_id, user_id):
+    group = await get_group(group_id)
+    if group is None or group.team_id != team_id or user_id not in group.members:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='Group does not exist'
+        )
+    return group
+
+def _group_response(group):
+    return {
+        'group_id': group.group_id,
+        'team_id': group.team_id,
+        'name': group.name,
+        'members': sorted(group.members),
+    }
+
+@router.post('/api/groups')
+async def create_chat_group(request: Request, params: CreateGroupRequest):
+    try:
+        cookies = request.cookies
+        await verify_cookies(cookies)
+        group = await create_group(
+            params.team_id, params.user_id, params.name, params.member_ids, cookies
+        )
+        return FastJSONResponse(_group_response(group), status_code=status.HTTP_201_CREATED)
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception:
+        logger.exception('Error creating group')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Internal Server Error'
+        )
+
+@router.get('/api/groups')
+async def get_chat_groups(request: Request, params: GroupQueryParams = Depends()):
+    try:
+        await verify_cookies(request.cookies)
+        groups = await get_user_groups(params.team_id, params.user_id)
+        return FastJSONResponse({'groups': groups, 'count': len(groups)})
+    except HTTPException as e:
+        raise e
+    except Exception:
+        logger.exception('Error listing groups')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Internal Server Error'
+        )
+
+@router.post('/api/groups/{group_id}/members')
+async def add_chat_group_members(
+    request: Request,
+    params: AddGroupMembersRequest,
+    group_id: uuid.UUID = Path(...),
+):
+    try:
+        cookies = request.cookies
+        await verify_cookies(cookies)
+        group = await _get_member_group(group_id, params.team_id, params.user_id)
+        group = await add_group_members(group, params.member_ids, cookies)
+        return FastJSONResponse(_group_response(group))
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception:
+        logger.exception('Error adding group members')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Internal Server Error'
+        )
+
+@router.delete('/api/groups/{group_id}/members')
+async def leave_chat_group(
+    request: Request,
+    params: GroupQueryParams = Depends(),
+    group_id: uuid.UUID = Path(...),
+):
+    try:
+        await verify_cookies(request.cookies)
+        group = await _get_member_group(group_id, params.team_id, params.user_id)
+        await leave_group(group, params.user_id)
+        return FastJSONResponse({'group_id': group_id, 'left': True})
+    except HTTPException as e:
+        raise e
+    except Exception:
+        logger.exception('Error leaving group')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Internal Server Error'
+        )
+
+@router.get('/api/groups/{group_id}/messages')
+async def get_chat_group_messages(
+    request: Request,
+    params: GroupMessagesQueryParams = Depends(),
+):
+    try:
+        await verify_cookies(request.cookies)
+        await _get_member_group(params.group_id, params.team_id, params.user_id)
+
+        before_id = None
+        if params.cursor:
+            before_id = decode_before_cursor(params.cursor)
+
+        rows, has_more = await get_group_messages_page(
+            params.group_id, params.limit, before_id
+        )
+        next_before = rows[-1].message_id if has_more else None
+
+        # Pages are read newest first but returned in chronological order
+        messages = [
+            {
+                'message_id': row.message_id,
+                'sender_id': row.sender_id,
+                'message_type': row.message_type,
+                'content': row.content,
+                'timestamp': row.created_at,
+            }
+            for row in reversed(rows)
+        ]
+        next_cursor = (
+            encode_cursor({'before': str(next_before)}) if next_before else None
+        )
+
+        return FastJSONResponse({
+            'group_id': params.group_id,
+            'messages': messages,
+            'count': len(messages),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+        })
+    except HTTPException as e:
+        raise e
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception:
+        logger.exception('Error fetching group messages')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail='Internal Server Error'
+        )
@@ -7,18 +7,42 @@ from fastapi import (
     Path,
 )
 
-from app.db.cassandra import get_cassandra_session
-from app.schemas.models.prekey import PrekeyBundle
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.schemas.models.prekey import (
+    PrekeyBundle,
+    PrekeyBundlesRequest,
+    PrekeyBundlesResponse,
+)
+from app.services.prekeys import (
+    get_prekey_bundle,
+    get_users_prekey_bundles,
+    store_one_time_prekeys,
+)
+from app.utils.logger import get_logger
+
+logger = get_logger('prekeys')
 
 router = APIRouter()
-session = get_cassandra_session()
 
 user_id_validation = Path(
     ..., 
     min_length=1,
     max_length=10, 
     pattern=r'^[0-9]+$'
-),
+)
+
+@router.post('/api/prekeys/bundles', response_model=PrekeyBundlesResponse)
+async def get_prekey_bundles(request: PrekeyBundlesRequest):
+    try:
+        user_ids = list(dict.fromkeys(request.user_ids))
+        return {'bundles': await get_users_prekey_bundles(user_ids)}
+    except Exception:
+        logger.exception('Error fetching prekey bundles')
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
+            detail='Internal Server Error'
+        )
 
 @router.get('/api/prekeys/exists/{user_id}/{device_id}')
 async def check_prekey_bundle_exists(
@@ -26,13 +50,10 @@ async def check_prekey_bundle_exists(
     device_id: UUID = Path(...),
 ):
     try:
-        row = session.execute(
-            '''
-            SELECT user_id FROM prekeys_by_user_device
-            WHERE user_id = %s AND device_id = %s
-            ''',
+        row = (await execute_async(
+            get_statement('select_prekey_exists'),
             (user_id, device_id)
-        ).one()
+        )).one()
 
         return {'exists': bool(row)}
     except Exception:
@@ -47,56 +68,25 @@ async def get_or_create_prekey_bundle(
     device_id: UUID = Path(...),
 ):
     try:
-        row = session.execute(
-            '''
-            SELECT * FROM prekeys_by_user_device
-            WHERE user_id = %s AND device_id = %s
-            ''',
-            (user_id, device_id)
-        ).one()
+        bundle = await get_prekey_bundle(user_id, device_id)
 
-        if not row:
+        if not bundle:
             raise HTTPException(
                 status_code=404, 
                 detail='No prekey bundle found — client should generate one.'
             )
 
-        one_time_row = session.execute(
-            '''
-            SELECT prekey_id, prekey FROM one_time_prekeys_by_user_device
-            WHERE user_id = %s AND device_id = %s AND used = false LIMIT 1
-            ''',
-            (user_id, device_id)
-        ).one()
-
-        if not one_time_row:
+        if not bundle['one_time_prekeys']:
             raise HTTPException(
                 status_code=410, 
                 detail='No available one-time prekeys'
             )
 
-        session.execute(
-            '''
-            UPDATE one_time_prekeys_by_user_device
-            SET used = true
-            WHERE user_id = %s AND device_id = %s AND prekey_id = %s
-            ''',
-            (user_id, device_id, one_time_row['prekey_id'])
-        )
-
-        return {
-            'identity_key': row['identity_key'],
-            'registration_id': row.get('registration_id', 0),
-            'signed_prekey': {
-                'keyId': row['signed_prekey_id'],
-                'publicKey': row['signed_prekey'],
-                'signature': row['signature']
-            },
-            'one_time_prekeys': {
-                one_time_row['prekey_id']: one_time_row['prekey']
-            }
-        }
+        return bundle
+    except HTTPException as e:
+        raise e
     except Exception:
+        logger.exception(f'Error fetching prekey bundle for {user_id}/{device_id}')
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail='Internal Server Error'
@@ -109,16 +99,8 @@ async def upload_prekey_bundle(
     device_id: UUID = Path(...),
 ):
     try:
-        print('bundle', bundle)
-        session.execute(
-            '''
-            INSERT INTO prekeys_by_user_device (
-                user_id, device_id, identity_key,
-                signed_prekey_id, signed_prekey, signature,
-                registration_id, signed_at, last_updated
-            )
-            VALUES (%s, %s, %s, %s, %s, %s, %s, toTimestamp(now()), toTimestamp(now()))
-            ''',
+        await execute_async(
+            get_statement('insert_prekey_bundle'),
             (
                 user_id,
                 device_id,
@@ -129,9 +111,10 @@ async def upload_prekey_bundle(
                 bundle.registration_id
             )
         )
-        return {'status': 'ok'}
-    except Exception as e:
-        print('Error uploading prekey bundle:', e)
+        await store_one_time_prekeys(user_id, device_id, bundle.one_time_prekeys)
+        return {'status': 'ok', 'one_time_prekeys': len(bundle.one_time_prekeys)}
+    except Exception:
+        logger.exception(f'Error uploading prekey bundle for {user_id}/{device_id}')
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, 
             detail='Internal Server Error'
@@ -7,8 +7,139 @@ class Settings(BaseSettings):
     CORS_ORIGINS: str = 'http://localhost:3000'
     DEBUG: bool = False
     SECRET_KEY: str
-    TOKEN_HASH_ALGORITHM: str = 'HS256"'
+    TOKEN_HASH_ALGORITHM: str = 'HS256'
+
+    # 'backend' asks the Django backend to verify every token, 'local'
+    # verifies the signature here and only asks the backend about
+    # revocation every AUTH_REVOCATION_CHECK_INTERVAL seconds (0 = never).
+    AUTH_MODE: str = 'backend'
+    AUTH_REVOCATION_CHECK_INTERVAL: float = 60.0
+    AUTH_TOKEN_CACHE_MAXSIZE: int = 50_000
+
+    # Backend (Django) HTTP client
+    BACKEND_HTTP_POOL_SIZE: int = 100
+    BACKEND_HTTP_POOL_PER_HOST: int = 50
+    BACKEND_HTTP_MAX_CONCURRENCY: int = 64
+    BACKEND_HTTP_TIMEOUT: float = 5.0
+    BACKEND_HTTP_KEEPALIVE: float = 30.0
+    BACKEND_CIRCUIT_FAILURE_THRESHOLD: int = 5
+    BACKEND_CIRCUIT_RESET_TIMEOUT: float = 10.0
+    BACKEND_MEMBERS_BATCH_PARAM: str = 'user_ids'
+
+    # Member profile cache
+    MEMBER_CACHE_MAXSIZE: int = 10_000
+    MEMBER_CACHE_TTL: float = 60.0
+    MEMBER_CACHE_REDIS: bool = False
+    MEMBER_CACHE_REDIS_TTL: int = 300
     
+    # Upper bound on index entries scanned per inbox search request
+    INBOX_SEARCH_SCAN_LIMIT: int = 1000
+
+    # Local full-text message index (SQLite FTS5)
+    SEARCH_INDEX_PATH: str = 'data/search_index.db'
+    SEARCH_INDEX_FLUSH_INTERVAL: float = 0.5
+    SEARCH_INDEX_BATCH_SIZE: int = 500
+    # Messages one search may copy from Cassandra per room; the rest (and
+    # first-time backfills for cross-room search) continue in the background
+    SEARCH_CATCH_UP_LIMIT: int = 500
+    SEARCH_BACKFILL_CONCURRENCY: int = 4
+    # How often live traffic moves an indexed room's watermark forward
+    SEARCH_LIVE_CATCH_UP_INTERVAL: float = 30.0
+
+    # Unread counters (Redis) drift reconciliation
+    UNREAD_RECONCILE_INTERVAL: float = 60.0
+    UNREAD_RECONCILE_BATCH: int = 500
+    UNREAD_RECONCILE_CONCURRENCY: int = 16
+    # Share of increments queued for a recount anyway, to catch drift
+    # nothing flagged
+    UNREAD_RECONCILE_SAMPLE_RATE: float = 0.01
+
+    # Write-behind window for user_chats_by_user.last_message updates
+    LAST_MESSAGE_WRITE_BEHIND_WINDOW: float = 0.25
+
+    # Read state: last_read write-behind and read receipt throttling
+    LAST_READ_WRITE_BEHIND_WINDOW: float = 1.0
+    READ_RECEIPT_INTERVAL: float = 1.0
+
+    # Known-room cache in front of the chat_rooms LWT
+    KNOWN_ROOMS_CACHE_MAXSIZE: int = 100_000
+    KNOWN_ROOMS_CACHE_TTL: float = 3600.0
+    KNOWN_ROOMS_WARM_ON_STARTUP: bool = True
+
+    # Room membership authorization cache
+    MEMBERSHIP_CACHE_MAXSIZE: int = 100_000
+    MEMBERSHIP_CACHE_TTL: float = 300.0
+    MEMBERSHIP_CACHE_NEGATIVE_TTL: float = 5.0
+
+    # Per-socket connection context
+    CONNECTION_COOKIE_NAMES: str = 'access,refresh'
+    CONNECTION_MAX_COOKIE_SIZE: int = 4096
+    CONNECTION_MAX_TEAMS: int = 64
+
+    # Presence (Redis, heartbeat-based expiry)
+    PRESENCE_TTL: float = 60.0
+    PRESENCE_HEARTBEAT_INTERVAL: float = 20.0
+    PRESENCE_DEBOUNCE: float = 2.0
+
+    # Publish socket emits only to the nodes holding recipients
+    SIO_NODE_ROUTING: bool = True
+    SIO_TRANSPORTS: str = 'polling,websocket'
+
+    # Socket event rate limits, "event=rate_per_second/burst" per user
+    RATE_LIMITS: str = 'send_direct_message=10/20,start_chat=2/10,sync=0.2/3,mark_read=20/40,send_group_message=10/20,join_groups=1/5'
+    RATE_LIMIT_DEFAULT: str = '20/40'
+    RATE_LIMIT_SHARED: bool = True
+    RATE_LIMIT_LOCAL_MAXSIZE: int = 100_000
+    CONNECTION_MAX_INFLIGHT: int = 8
+
+    # Reconnect delta sync
+    SYNC_MAX_ROOMS: int = 500
+    SYNC_MAX_MESSAGES_PER_ROOM: int = 200
+    SYNC_ROOMS_CHUNK_SIZE: int = 50
+
+    # One-time prekey pool (Redis in front of Cassandra)
+    PREKEY_UPLOAD_BATCH_SIZE: int = 100
+    PREKEY_POOL_REFILL_LIMIT: int = 1000
+    PREKEY_POOL_TTL: int = 86400
+    PREKEY_CLAIMED_TTL: int = 86400
+    PREKEY_EMPTY_TTL: int = 30
+    PREKEY_LOW_WATERMARK: int = 10
+
+    # Group chat
+    GROUP_MAX_MEMBERS: int = 5000
+    GROUP_CACHE_MAXSIZE: int = 10_000
+    GROUP_CACHE_TTL: float = 60.0
+    GROUP_MESSAGE_BUCKET: str = 'day'
+    GROUP_FANOUT_WINDOW: float = 1.0
+    GROUP_FANOUT_CONCURRENCY: int = 64
+    GROUP_FANOUT_PIPELINE_SIZE: int = 1000
+
+    # Direct message storage: 'legacy' (direct_messages only), 'dual' (write
+    # both, read legacy; run the migration in this mode) or 'bucketed'
+    DIRECT_MESSAGES_STORAGE: str = 'dual'
+    DIRECT_MESSAGE_BUCKET: str = 'month'
+
+    # Bucket index rows read per round trip by bucketed history readers
+    BUCKET_INDEX_SCAN_SIZE: int = 8
+
+    # Ephemeral signals (typing indicators)
+    EPHEMERAL_TTL: float = 6.0
+    EPHEMERAL_THROTTLE: float = 2.0
+    EPHEMERAL_CACHE_MAXSIZE: int = 50000
+
+    # Production launcher (python -m app.server)
+    SERVER_HOST: str = '0.0.0.0'
+    SERVER_PORT: int = 8001
+    SERVER_WORKERS: int = 0  # 0 = one per CPU
+    SERVER_LOOP: str = 'uvloop'
+    SERVER_HTTP: str = 'httptools'
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_TIMEOUT: int = 5
+    SERVER_GRACEFUL_SHUTDOWN_TIMEOUT: int = 30
+    SERVER_DRAIN_GRACE_PERIOD: float = 5.0
+    SERVER_DRAIN_RETRY_AFTER: float = 1.0
+    SERVER_FORWARDED_ALLOW_IPS: str = '127.0.0.1'
+
     class Config:
         env_file = ".env"
         env_file_encoding = 'utf-8'
@@ -0,0 +1,82 @@
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+
+from cassandra.cluster import ResponseFuture, ResultSet
+
+from app.db.cassandra import get_cassandra_session
+
+
+class AsyncResultSet:
+    """asyncio view of a driver ResponseFuture.
+
+    `current_rows` holds the page that was fetched last. Iterating with
+    `async for` yields every row and fetches further pages on demand
+    without blocking the event loop.
+    """
+
+    def __init__(self, response_future: ResponseFuture):
+        self.response_future = response_future
+        self.current_rows: List[Any] = []
+        self._loop = asyncio.get_running_loop()
+        self._waiter = self._loop.create_future()
+        # Driver callbacks stay registered for every page, so they are
+        # attached once and always resolve the current waiter.
+        response_future.add_callbacks(self._on_result, self._on_error)
+
+    def _on_result(self, rows):
+        self._loop.call_soon_threadsafe(self._resolve, rows, None)
+
+    def _on_error(self, exc):
+        self._loop.call_soon_threadsafe(self._resolve, None, exc)
+
+    def _resolve(self, rows, exc):
+        if self._waiter.done():
+            return
+        if exc is not None:
+            self._waiter.set_exception(exc)
+        else:
+            self._waiter.set_result(rows)
+
+    async def _wait(self) -> 'AsyncResultSet':
+        rows = await self._waiter
+        self.current_rows = list(rows or [])
+        return self
+
+    @property
+    def has_more_pages(self) -> bool:
+        return self.response_future.has_more_pages
+
+    @property
+    def paging_state(self) -> Optional[bytes]:
+        return self.response_future._paging_state
+
+    @property
+    def was_applied(self) -> bool:
+        return ResultSet(self.response_future, self.current_rows).was_applied
+
+    def one(self) -> Optional[Any]:
+        return self.current_rows[0] if self.current_rows else None
+
+    async def fetch_next_page(self) -> List[Any]:
+        self._waiter = self._loop.create_future()
+        self.response_future.start_fetching_next_page()
+        await self._wait()
+        return self.current_rows
+
+    async def all(self) -> List[Any]:
+        return [row async for row in self]
+
+    async def __aiter__(self) -> AsyncIterator[Any]:
+        rows = self.current_rows
+        while True:
+            for row in rows:
+                yield row
+            if not self.has_more_pages:
+                return
+            rows = await self.fetch_next_page()
+
+
+async def execute_async(query, parameters=None, session=None, **kwargs) -> AsyncResultSet:
+    session = session or get_cassandra_session()
+    result = AsyncResultSet(session.execute_async(query, parameters, **kwargs))
+    return await result._wait()
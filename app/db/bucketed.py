@@ -0,0 +1,123 @@
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Hashable, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.utils.buckets import MAX_BUCKET, bucket_of_uuid
+from app.utils.cache import TTLCache
+
+# (bucket index statement, partition, bucket) already recorded by this node
+_known_buckets = TTLCache(maxsize=100_000, ttl=3600)
+
+# LIMIT bound when every row after a position is wanted; paging still
+# applies, so this only removes the cap.
+_NO_LIMIT = 2 ** 31 - 1
+
+
+@dataclass(frozen=True)
+class BucketedTable:
+    """A message table partitioned by (key, time bucket).
+
+    Each table has a companion index of the buckets a key has rows in,
+    clustered newest first, so readers can walk only non-empty buckets.
+    Fields are statement names; page statements take (key, bucket[,
+    before_id / after_id], limit), the bucket index takes (key, bucket < ?,
+    limit) and the count takes (key, bucket, after_id).
+    """
+
+    unit: str
+    insert_bucket: str
+    select_buckets: str
+    select_page: str
+    select_page_before: str
+    select_page_after: Optional[str] = None
+    count_after: Optional[str] = None
+
+    def bucket_of(self, message_id: uuid.UUID) -> int:
+        return bucket_of_uuid(message_id, self.unit)
+
+    async def remember_bucket(self, key: Hashable, bucket: int):
+        cache_key = (self.insert_bucket, key, bucket)
+        if _known_buckets.get(cache_key):
+            return
+        await execute_async(get_statement(self.insert_bucket), (key, bucket))
+        _known_buckets.set(cache_key, True)
+
+    async def iter_buckets(
+        self,
+        key: Hashable,
+        upper: int = MAX_BUCKET,
+        lowest: int = 0,
+    ) -> AsyncIterator[int]:
+        # Non-empty buckets below `upper` and not below `lowest`, newest first
+        scan = settings.BUCKET_INDEX_SCAN_SIZE
+        while True:
+            rows = (await execute_async(
+                get_statement(self.select_buckets), (key, upper, scan)
+            )).current_rows
+            for row in rows:
+                if row.bucket < lowest:
+                    return
+                yield row.bucket
+            if len(rows) < scan:
+                return
+            upper = rows[-1].bucket
+
+    async def read_page(
+        self,
+        key: Hashable,
+        limit: int,
+        before_id: Optional[uuid.UUID] = None,
+    ) -> Tuple[List[Any], bool]:
+        # Newest first, stopping as soon as limit + 1 rows are in hand
+        # (the extra row means "has more").
+        wanted = limit + 1
+        rows: List[Any] = []
+        upper = MAX_BUCKET if before_id is None else self.bucket_of(before_id) + 1
+
+        async for bucket in self.iter_buckets(key, upper):
+            if before_id is not None:
+                result = await execute_async(
+                    get_statement(self.select_page_before),
+                    (key, bucket, before_id, wanted - len(rows))
+                )
+            else:
+                result = await execute_async(
+                    get_statement(self.select_page),
+                    (key, bucket, wanted - len(rows))
+                )
+            rows.extend(result.current_rows)
+            if len(rows) >= wanted:
+                break
+
+        return rows[:limit], len(rows) > limit
+
+    async def iter_after(
+        self,
+        key: Hashable,
+        after_id: uuid.UUID,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[Any]:
+        # Rows newer than after_id, newest first, at most `limit`
+        remaining = _NO_LIMIT if limit is None else limit
+        async for bucket in self.iter_buckets(key, lowest=self.bucket_of(after_id)):
+            rows = await execute_async(
+                get_statement(self.select_page_after),
+                (key, bucket, after_id, remaining)
+            )
+            async for row in rows:
+                yield row
+                remaining -= 1
+                if remaining <= 0:
+                    return
+
+    async def count_rows_after(self, key: Hashable, after_id: uuid.UUID) -> int:
+        total = 0
+        async for bucket in self.iter_buckets(key, lowest=self.bucket_of(after_id)):
+            row = (await execute_async(
+                get_statement(self.count_after), (key, bucket, after_id)
+            )).one()
+            total += row.count if row else 0
+        return total
@@ -0,0 +1,19 @@
+from typing import Optional
+
+from redis import asyncio as aioredis
+
+from app.config.settings import settings
+
+_redis: Optional[aioredis.Redis] = None
+
+def get_redis() -> aioredis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = aioredis.Redis.from_url(settings.REDIS_URL, decode_responses=True)
+    return _redis
+
+async def close_redis():
+    global _redis
+    if _redis is not None:
+        await _redis.close()
+        _redis = None
@@ -0,0 +1,465 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from cassandra import ConsistencyLevel
+from cassandra.query import PreparedStatement
+
+from app.db.cassandra import get_cassandra_session
+from app.utils.logger import get_logger
+
+logger = get_logger('cassandra')
+
+
+@dataclass(frozen=True)
+class StatementSpec:
+    cql: str
+    consistency_level: Optional[int] = None
+    idempotent: bool = False
+
+
+# Hot-path queries, prepared once at startup and bound per call.
+STATEMENTS: Dict[str, StatementSpec] = {
+    # chat rooms
+    'insert_chat_room': StatementSpec(
+        """
+        INSERT INTO chat_rooms (team_id, room_id, user1_id, user2_id, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        IF NOT EXISTS
+        """,
+    ),
+    'insert_user_chat': StatementSpec(
+        """
+        INSERT INTO user_chats_by_user (
+            team_id, room_id, user_id, participant_id, created_at
+        )
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        idempotent=True,
+    ),
+    'select_user_rooms': StatementSpec(
+        """
+        SELECT room_id, participant_id, last_message, last_message_type,
+            last_message_timestamp, created_at
+        FROM user_chats_by_user WHERE team_id = ? AND user_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_user_room': StatementSpec(
+        """
+        SELECT room_id, participant_id, last_message, last_message_type,
+            last_message_timestamp, created_at
+        FROM user_chats_by_user WHERE team_id = ? AND user_id = ? AND room_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_room_activity': StatementSpec(
+        """
+        SELECT last_message_timestamp, created_at FROM user_chats_by_user
+        WHERE team_id = ? AND user_id = ? AND room_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_room_membership': StatementSpec(
+        """
+        SELECT room_id, participant_id FROM user_chats_by_user
+        WHERE team_id = ? AND room_id = ? AND user_id = ? LIMIT 1
+        """,
+        idempotent=True,
+    ),
+    'select_last_read': StatementSpec(
+        """
+        SELECT last_read FROM user_chats_by_user
+        WHERE team_id = ? AND room_id = ? AND user_id = ?
+        """,
+        idempotent=True,
+    ),
+    'update_last_read': StatementSpec(
+        """
+        UPDATE user_chats_by_user
+        USING TIMESTAMP ?
+        SET last_read = ?
+        WHERE user_id = ? AND room_id = ? AND team_id = ?
+        """,
+        idempotent=True,
+    ),
+    'update_last_message': StatementSpec(
+        """
+        UPDATE user_chats_by_user
+        USING TIMESTAMP ?
+        SET last_message = ?, last_message_type = ?, last_message_timestamp = ?
+        WHERE team_id = ? AND user_id = ? AND room_id = ?
+        """,
+        idempotent=True,
+    ),
+
+    # inbox index
+    'insert_inbox_entry': StatementSpec(
+        """
+        INSERT INTO user_inbox_by_user (team_id, user_id, last_message_timestamp, room_id)
+        VALUES (?, ?, ?, ?)
+        USING TIMESTAMP ?
+        """,
+        idempotent=True,
+    ),
+    'delete_inbox_entry': StatementSpec(
+        """
+        DELETE FROM user_inbox_by_user
+        WHERE team_id = ? AND user_id = ? AND last_message_timestamp = ? AND room_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_inbox_page': StatementSpec(
+        """
+        SELECT last_message_timestamp, room_id FROM user_inbox_by_user
+        WHERE team_id = ? AND user_id = ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_inbox_page_after': StatementSpec(
+        """
+        SELECT last_message_timestamp, room_id FROM user_inbox_by_user
+        WHERE team_id = ? AND user_id = ?
+            AND (last_message_timestamp, room_id) < (?, ?)
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_inbox_since': StatementSpec(
+        """
+        SELECT last_message_timestamp, room_id FROM user_inbox_by_user
+        WHERE team_id = ? AND user_id = ? AND last_message_timestamp > ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+
+    # direct messages
+    'insert_direct_message': StatementSpec(
+        """
+        INSERT INTO direct_messages (
+            room_id, message_id, sender_id, receiver_id,
+            message_type, content, timestamp
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        consistency_level=ConsistencyLevel.QUORUM,
+        idempotent=True,
+    ),
+    'count_unread_messages': StatementSpec(
+        """
+        SELECT COUNT(*) FROM direct_messages
+        WHERE room_id = ? AND message_id > ?
+        """,
+        idempotent=True,
+    ),
+    'select_room_messages_page': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id,
+            content, message_type, attachment_url,
+            file_name, file_size, mime_type, timestamp
+        FROM direct_messages
+        WHERE room_id = ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_room_messages_page_before': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id,
+            content, message_type, attachment_url,
+            file_name, file_size, mime_type, timestamp
+        FROM direct_messages
+        WHERE room_id = ? AND message_id < ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_room_messages_after_page': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id, content, timestamp
+        FROM direct_messages
+        WHERE room_id = ? AND message_id > ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_room_messages_after': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id, content, timestamp
+        FROM direct_messages
+        WHERE room_id = ? AND message_id > ?
+        """,
+        idempotent=True,
+    ),
+
+    # direct messages, partitioned by (room_id, month)
+    'insert_bucketed_direct_message': StatementSpec(
+        """
+        INSERT INTO direct_messages_by_bucket (
+            room_id, bucket, message_id, sender_id, receiver_id,
+            message_type, content, timestamp
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        consistency_level=ConsistencyLevel.QUORUM,
+        idempotent=True,
+    ),
+    'migrate_direct_message': StatementSpec(
+        """
+        INSERT INTO direct_messages_by_bucket (
+            room_id, bucket, message_id, sender_id, receiver_id,
+            message_type, content, attachment_url, file_name,
+            file_size, mime_type, timestamp
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        USING TIMESTAMP ?
+        """,
+        idempotent=True,
+    ),
+    'insert_direct_message_bucket': StatementSpec(
+        """
+        INSERT INTO direct_message_buckets (room_id, bucket) VALUES (?, ?)
+        """,
+        idempotent=True,
+    ),
+    'select_direct_message_buckets': StatementSpec(
+        """
+        SELECT bucket FROM direct_message_buckets
+        WHERE room_id = ? AND bucket < ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_bucketed_messages_page': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id,
+            content, message_type, attachment_url,
+            file_name, file_size, mime_type, timestamp
+        FROM direct_messages_by_bucket
+        WHERE room_id = ? AND bucket = ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_bucketed_messages_page_before': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id,
+            content, message_type, attachment_url,
+            file_name, file_size, mime_type, timestamp
+        FROM direct_messages_by_bucket
+        WHERE room_id = ? AND bucket = ? AND message_id < ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_bucketed_messages_after': StatementSpec(
+        """
+        SELECT message_id, sender_id, receiver_id, content, timestamp
+        FROM direct_messages_by_bucket
+        WHERE room_id = ? AND bucket = ? AND message_id > ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'count_bucketed_messages_after': StatementSpec(
+        """
+        SELECT COUNT(*) FROM direct_messages_by_bucket
+        WHERE room_id = ? AND bucket = ? AND message_id > ?
+        """,
+        idempotent=True,
+    ),
+
+    # groups
+    'insert_chat_group': StatementSpec(
+        """
+        INSERT INTO chat_groups (group_id, team_id, name, created_by, created_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        idempotent=True,
+    ),
+    'select_chat_group': StatementSpec(
+        """
+        SELECT team_id, name FROM chat_groups WHERE group_id = ?
+        """,
+        idempotent=True,
+    ),
+    'insert_group_member': StatementSpec(
+        """
+        INSERT INTO group_members (group_id, user_id, group_name, joined_at)
+        VALUES (?, ?, ?, ?)
+        """,
+        idempotent=True,
+    ),
+    'delete_group_member': StatementSpec(
+        """
+        DELETE FROM group_members WHERE group_id = ? AND user_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_group_members': StatementSpec(
+        """
+        SELECT user_id FROM group_members WHERE group_id = ?
+        """,
+        idempotent=True,
+    ),
+    'insert_user_group': StatementSpec(
+        """
+        INSERT INTO groups_by_user (team_id, user_id, group_id, group_name, joined_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        idempotent=True,
+    ),
+    'delete_user_group': StatementSpec(
+        """
+        DELETE FROM groups_by_user
+        WHERE team_id = ? AND user_id = ? AND group_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_user_groups': StatementSpec(
+        """
+        SELECT group_id, group_name, joined_at, last_message, last_message_type,
+            last_message_timestamp, last_sender_id
+        FROM groups_by_user WHERE team_id = ? AND user_id = ?
+        """,
+        idempotent=True,
+    ),
+    'update_user_group_last_message': StatementSpec(
+        """
+        UPDATE groups_by_user
+        USING TIMESTAMP ?
+        SET last_message = ?, last_message_type = ?,
+            last_message_timestamp = ?, last_sender_id = ?
+        WHERE team_id = ? AND user_id = ? AND group_id = ?
+        """,
+        idempotent=True,
+    ),
+    'insert_group_message': StatementSpec(
+        """
+        INSERT INTO group_messages_by_bucket (
+            group_id, bucket, message_id, sender_id,
+            message_type, content, created_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        consistency_level=ConsistencyLevel.QUORUM,
+        idempotent=True,
+    ),
+    'insert_group_message_bucket': StatementSpec(
+        """
+        INSERT INTO group_message_buckets (group_id, bucket) VALUES (?, ?)
+        """,
+        idempotent=True,
+    ),
+    'select_group_message_buckets': StatementSpec(
+        """
+        SELECT bucket FROM group_message_buckets
+        WHERE group_id = ? AND bucket < ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_group_messages_page': StatementSpec(
+        """
+        SELECT message_id, sender_id, message_type, content, created_at
+        FROM group_messages_by_bucket
+        WHERE group_id = ? AND bucket = ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'select_group_messages_page_before': StatementSpec(
+        """
+        SELECT message_id, sender_id, message_type, content, created_at
+        FROM group_messages_by_bucket
+        WHERE group_id = ? AND bucket = ? AND message_id < ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+
+    # prekeys
+    'select_prekey_exists': StatementSpec(
+        """
+        SELECT user_id FROM prekeys_by_user_device
+        WHERE user_id = ? AND device_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_prekey_bundle': StatementSpec(
+        """
+        SELECT * FROM prekeys_by_user_device
+        WHERE user_id = ? AND device_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_user_prekey_bundles': StatementSpec(
+        """
+        SELECT * FROM prekeys_by_user_device
+        WHERE user_id = ?
+        """,
+        idempotent=True,
+    ),
+    'select_one_time_prekeys': StatementSpec(
+        """
+        SELECT prekey_id, prekey, used FROM one_time_prekeys_by_user_device
+        WHERE user_id = ? AND device_id = ?
+        LIMIT ?
+        """,
+        idempotent=True,
+    ),
+    'insert_one_time_prekey': StatementSpec(
+        """
+        INSERT INTO one_time_prekeys_by_user_device (
+            user_id, device_id, prekey_id, prekey, used, uploaded_at
+        )
+        VALUES (?, ?, ?, ?, false, toTimestamp(now()))
+        """,
+        idempotent=True,
+    ),
+    'claim_one_time_prekey': StatementSpec(
+        """
+        DELETE FROM one_time_prekeys_by_user_device
+        WHERE user_id = ? AND device_id = ? AND prekey_id = ?
+        IF EXISTS
+        """,
+    ),
+    'insert_prekey_bundle': StatementSpec(
+        """
+        INSERT INTO prekeys_by_user_device (
+            user_id, device_id, identity_key,
+            signed_prekey_id, signed_prekey, signature,
+            registration_id, signed_at, last_updated
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, toTimestamp(now()), toTimestamp(now()))
+        """,
+    ),
+}
+
+_prepared: Dict[str, PreparedStatement] = {}
+
+
+def _prepare(session, name: str) -> PreparedStatement:
+    spec = STATEMENTS[name]
+    prepared = session.prepare(spec.cql)
+    if spec.consistency_level is not None:
+        prepared.consistency_level = spec.consistency_level
+    prepared.is_idempotent = spec.idempotent
+    _prepared[name] = prepared
+    return prepared
+
+
+def prepare_statements(session=None):
+    session = session or get_cassandra_session()
+    for name in STATEMENTS:
+        _prepare(session, name)
+    logger.info(f'Prepared {len(_prepared)} statements')
+
+
+def get_statement(name: str) -> PreparedStatement:
+    prepared = _prepared.get(name)
+    if prepared is None:
+        # Only reached if startup preparation was skipped (e.g. scripts).
+        prepared = _prepare(get_cassandra_session(), name)
+    return prepared
@@ -1,15 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from socketio import ASGIApp
 
+from .api.responses import FastJSONResponse
+from .config.settings import settings
 from .sio_server import sio, origins
 from .services import socketio
-from .api.routes import chat, prekeys
+from .api.routes import chat, debug, groups, prekeys
+from .db.redis import close_redis
+from .db.statements import prepare_statements
+from .services.groups import run_group_change_listener
+from .services.presence import run_presence_heartbeat
+from .services.room_cache import warm_known_rooms
+from .services.search import search_index
+from .services.unread import run_unread_reconciler
+from .services.write_behind import start_writers, close_writers
+from .utils.http_client import start_backend_client, close_backend_client
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.to_thread(prepare_statements)
+    await start_backend_client()
+    await search_index.start()
+    start_writers()
+    reconciler = asyncio.create_task(run_unread_reconciler())
+    heartbeat = asyncio.create_task(run_presence_heartbeat())
+    group_changes = asyncio.create_task(run_group_change_listener())
+    warmer = None
+    if settings.KNOWN_ROOMS_WARM_ON_STARTUP:
+        warmer = asyncio.create_task(warm_known_rooms())
+    try:
+        yield
+    finally:
+        reconciler.cancel()
+        heartbeat.cancel()
+        group_changes.cancel()
+        if warmer is not None:
+            warmer.cancel()
+        await close_writers()
+        await search_index.close()
+        await close_backend_client()
+        await close_redis()
+
 
 fastapi_app = FastAPI(
     docs_url='/api/docs',
     openapi_url='/api/openapi.json',
-    redoc_url=None
+    redoc_url=None,
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan,
 )
 
 fastapi_app.add_middleware(
@@ -21,8 +64,12 @@ fastapi_app.add_middleware(
 )
 
 fastapi_app.include_router(chat.router)
+fastapi_app.include_router(groups.router)
 fastapi_app.include_router(prekeys.router)
 
+if settings.DEBUG:
+    fastapi_app.include_router(debug.router)
+
 app = ASGIApp(
     socketio_server=sio,
     other_asgi_app=fastapi_app,
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 @dataclass
 class RoomDetailsParams:
@@ -12,9 +12,20 @@ class RoomDetailsParams:
     last_message_type: str
     created_at: datetime
     cookies: Dict[str, str]
+    last_message_timestamp: Optional[datetime] = None
+    unread_count: int = 0
+    is_participant_online: bool = False
 
     @classmethod
-    def from_row(cls, row: Any, team_id: str, user_id: str, cookies: Dict[str, str]) -> 'RoomDetailsParams':
+    def from_row(
+        cls,
+        row: Any,
+        team_id: str,
+        user_id: str,
+        cookies: Dict[str, str],
+        unread_count: int = 0,
+        is_participant_online: bool = False,
+    ) -> 'RoomDetailsParams':
         return cls(
             team_id=team_id,
             room_id=row.room_id,
@@ -24,4 +35,7 @@ class RoomDetailsParams:
             last_message_type=row.last_message_type,
             created_at=row.created_at,
             cookies=cookies,
+            last_message_timestamp=row.last_message_timestamp,
+            unread_count=unread_count,
+            is_participant_online=is_participant_online,
         )
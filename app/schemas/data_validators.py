@@ -1,6 +1,7 @@
 from datetime import datetime
-from pydantic import BaseModel, Field, field_validator, model_validator
-from typing import Optional
+from uuid import UUID
+from pydantic import BaseModel, Field, StringConstraints, field_validator, model_validator
+from typing import Annotated, Dict, List, Optional
 
 team_id_validation = Field(
     ..., min_length=9, 
@@ -15,9 +16,14 @@ user_id_validation = Field(
 room_id_validation = Field(
     ..., 
     min_length=1, 
-    max_length=10, 
+    max_length=40, 
     pattern=r'^[a-zA-Z0-9_]+$',
 )
+group_name_validation = Field(..., min_length=1, max_length=100)
+member_ids_validation = Field(..., min_length=1, max_length=500)
+member_id_type = Annotated[
+    str, StringConstraints(min_length=1, max_length=10, pattern=r'^[0-9]+$')
+]
 
 class BaseValidator(BaseModel):
     @field_validator('*', mode='before')
@@ -98,9 +104,89 @@ class QueryParams(BaseValidator):
     user_id: str = user_id_validation
     search: Optional[str] = Field(None, max_length=50)
     limit: int = Field(10, ge=1, le=100)
-    skip: int = Field(0, ge=0)
+    cursor: Optional[str] = Field(None, max_length=200)
 
 
-class RoomMessagesQueryParams(QueryParams):
+class RoomMessagesQueryParams(BaseValidator):
+    team_id: str = team_id_validation
+    user_id: str = user_id_validation
     room_id: str = room_id_validation
+    search: Optional[str] = Field(None, max_length=50)
+    limit: int = Field(10, ge=1, le=100)
     before: Optional[datetime] = Field(None)
+    cursor: Optional[str] = Field(None, max_length=200)
+
+
+class SearchQueryParams(BaseValidator):
+    team_id: str = team_id_validation
+    user_id: str = user_id_validation
+    q: str = Field(..., min_length=1, max_length=100)
+    room_id: Optional[str] = Field(
+        None,
+        min_length=1,
+        max_length=40,
+        pattern=r'^[a-zA-Z0-9_]+$',
+    )
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = Field(None, max_length=200)
+
+
+class MarkReadValidator(BaseValidator):
+    room_id: str = room_id_validation
+    message_id: UUID
+
+
+class SyncValidator(BaseValidator):
+    team_id: str = team_id_validation
+    # Global watermark: epoch milliseconds of the newest activity seen
+    since: Optional[int] = Field(None, ge=0)
+    # Last message_id seen, per room
+    rooms: Dict[str, str] = Field(default_factory=dict, max_length=500)
+
+    @model_validator(mode='after')
+    def validate_cursors(self):
+        if self.since is None and not self.rooms:
+            raise ValueError('Either since or rooms is required')
+        return self
+
+
+class SyncRequest(SyncValidator):
+    user_id: str = user_id_validation
+
+
+class JoinGroupsValidator(BaseValidator):
+    team_id: str = team_id_validation
+
+
+class GroupValidator(BaseValidator):
+    group_id: UUID
+
+
+class SendGroupMessageValidator(GroupValidator):
+    message_type: str = Field(
+        ...,
+        min_length=1,
+        max_length=10,
+        pattern=r'^text$',
+    )
+    content: str = Field(..., min_length=1, max_length=1000)
+
+
+class GroupQueryParams(BaseValidator):
+    team_id: str = team_id_validation
+    user_id: str = user_id_validation
+
+
+class GroupMessagesQueryParams(GroupQueryParams):
+    group_id: UUID
+    limit: int = Field(20, ge=1, le=100)
+    cursor: Optional[str] = Field(None, max_length=200)
+
+
+class CreateGroupRequest(GroupQueryParams):
+    name: str = group_name_validation
+    member_ids: List[member_id_type] = member_ids_validation
+
+
+class AddGroupMembersRequest(GroupQueryParams):
+    member_ids: List[member_id_type] = member_ids_validation
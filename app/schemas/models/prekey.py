@@ -1,5 +1,7 @@
-from pydantic import BaseModel, Field
-from typing import Dict
+from uuid import UUID
+
+from pydantic import BaseModel, Field, StringConstraints
+from typing import Annotated, Dict, List
 
 class SignedPreKey(BaseModel):
     key_id: int = Field(..., alias='keyId')
@@ -22,3 +24,23 @@ class PrekeyBundle(BaseModel):
         "populate_by_name": True,
         "validate_by_name": True
     }
+
+
+class DevicePrekeyBundle(PrekeyBundle):
+    device_id: UUID = Field(..., alias='deviceId')
+
+
+class PrekeyBundlesRequest(BaseModel):
+    user_ids: List[
+        Annotated[str, StringConstraints(min_length=1, max_length=10, pattern=r'^[0-9]+$')]
+    ] = Field(..., alias='userIds', min_length=1, max_length=50)
+
+    model_config = {
+        "populate_by_name": True,
+        "validate_by_name": True
+    }
+
+
+class PrekeyBundlesResponse(BaseModel):
+    # user_id -> one bundle per device; users without devices map to []
+    bundles: Dict[str, List[DevicePrekeyBundle]]
@@ -0,0 +1,54 @@
+"""Populate user_inbox_by_user from existing user_chats_by_user rows.
+
+Safe to run while the service is live: inserts are idempotent, and any
+entry that a concurrent message makes obsolete is cleaned up by the
+inbox reader.
+
+    python -m app.scripts.backfill_inbox
+"""
+import asyncio
+
+from cassandra.query import SimpleStatement
+
+from app.db.async_cassandra import execute_async
+from app.services.inbox import add_inbox_entry, room_activity
+from app.utils.logger import get_logger
+
+logger = get_logger('backfill_inbox')
+
+
+async def backfill(concurrency: int = 32):
+    semaphore = asyncio.Semaphore(concurrency)
+    copied = 0
+
+    async def copy(row):
+        nonlocal copied
+        async with semaphore:
+            await add_inbox_entry(row.team_id, row.user_id, row.room_id, room_activity(row))
+            copied += 1
+
+    rows = await execute_async(SimpleStatement(
+        """
+        SELECT team_id, user_id, room_id, last_message_timestamp, created_at
+        FROM user_chats_by_user
+        """,
+        fetch_size=500,
+    ))
+
+    pending = set()
+    async for row in rows:
+        if room_activity(row) is None:
+            continue
+        pending.add(asyncio.create_task(copy(row)))
+        if len(pending) >= concurrency * 4:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    if pending:
+        await asyncio.gather(*pending)
+
+    logger.info(f'Backfilled {copied} inbox entries')
+
+
+if __name__ == '__main__':
+    asyncio.run(backfill())
@@ -0,0 +1,82 @@
+"""Compare payload size and encode time of the socket/REST serializers.
+
+Payloads mirror a 100-message history page and a 200-room inbox page.
+No services are needed.
+
+    python -m app.scripts.bench_serializers
+"""
+import json
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from app.utils.serializers import dumps_bytes, msgpack_available, packb
+
+
+def _history_page(n: int = 100, iso: bool = False):
+    start = datetime(2025, 1, 1, 12, 0, 0, 123000)
+    messages = []
+    for i in range(n):
+        ts = start + timedelta(seconds=i * 7)
+        messages.append({
+            'message_id': str(uuid.uuid1()) if iso else uuid.uuid1(),
+            'sender_id': str(1000 + i % 2),
+            'content': f'Message number {i} with a bit of text to look realistic',
+            'timestamp': ts.isoformat() if iso else ts,
+        })
+    return {
+        'room_id': 'room_team000001_1000_1001',
+        'messages': messages,
+        'count': n,
+        'next_cursor': 'eyJiZWZvcmUiOiAiMDAwMDAwMDAifQ',
+        'has_more': True,
+    }
+
+
+def _inbox_page(n: int = 200, iso: bool = False):
+    start = datetime(2025, 1, 1, 12, 0, 0, 456000)
+    rooms = []
+    for i in range(n):
+        created = start - timedelta(days=i)
+        last = start - timedelta(minutes=i)
+        rooms.append({
+            'room_id': f'room_team000001_1000_{2000 + i}',
+            'participant_id': str(2000 + i),
+            'participant_name': f'Participant {i}',
+            'is_participant_online': i % 3 == 0,
+            'participant_profile_pic': f'https://cdn.example.com/avatars/{2000 + i}.png',
+            'last_message': 'See you tomorrow at the standup',
+            'last_message_type': 'text',
+            'last_message_timestamp': last.isoformat() if iso else last,
+            'unread_messages_count': i % 5,
+            'created_at': created.isoformat() if iso else created,
+        })
+    return {'rooms': rooms, 'count': n, 'next_cursor': None, 'has_more': False}
+
+
+def _bench(name: str, build, number: int):
+    # The stdlib baseline includes the isoformat()/str() calls that the
+    # orjson and msgpack paths no longer need.
+    candidates = [
+        ('json (stdlib)', lambda: json.dumps(build(iso=True)).encode('utf-8')),
+        ('orjson', lambda: dumps_bytes(build())),
+    ]
+    if msgpack_available():
+        candidates.append(('msgpack', lambda: packb(build())))
+
+    build_cost = min(timeit.repeat(build, number=number, repeat=3)) / number
+    print(f'\n{name}')
+    print(f'{"serializer":<16}{"bytes":>10}{"encode (us)":>14}')
+    for label, encode in candidates:
+        size = len(encode())
+        elapsed = min(timeit.repeat(encode, number=number, repeat=3)) / number
+        print(f'{label:<16}{size:>10}{(elapsed - build_cost) * 1e6:>14.1f}')
+
+
+def main(number: int = 200):
+    _bench('history page (100 messages)', _history_page, number)
+    _bench('inbox page (200 rooms)', _inbox_page, number)
+
+
+if __name__ == '__main__':
+    main()
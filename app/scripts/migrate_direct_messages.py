@@ -0,0 +1,98 @@
+"""Copy direct_messages into the bucketed direct_messages_by_bucket layout.
+
+Run while the service is live with DIRECT_MESSAGES_STORAGE=dual, so new
+messages already land in both tables; once this finishes, switch the
+service to bucketed. Rows are copied with their original write time, so
+re-running (or overlapping with dual writes) never overwrites newer data.
+Progress is logged as a token; pass it back with --from-token to resume.
+
+    python -m app.scripts.migrate_direct_messages [--from-token N]
+"""
+import argparse
+import asyncio
+
+from cassandra.query import UNSET_VALUE, SimpleStatement
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.services.direct_messages import DIRECT_MESSAGES
+from app.utils.logger import get_logger
+
+logger = get_logger('migrate_direct_messages')
+
+_MIN_TOKEN = -2 ** 63
+
+
+async def migrate(from_token: int = _MIN_TOKEN, concurrency: int = 32, fetch_size: int = 500):
+    if settings.DIRECT_MESSAGES_STORAGE == 'legacy':
+        logger.warning(
+            'DIRECT_MESSAGES_STORAGE is legacy; messages sent during the '
+            'migration will be missing from the bucketed table'
+        )
+
+    semaphore = asyncio.Semaphore(concurrency)
+    insert = get_statement('migrate_direct_message')
+    copied = 0
+
+    async def copy(row):
+        nonlocal copied
+        async with semaphore:
+            bucket = DIRECT_MESSAGES.bucket_of(row.message_id)
+            await DIRECT_MESSAGES.remember_bucket(row.room_id, bucket)
+            # Unset rather than null, so text messages don't write a
+            # tombstone for every empty attachment column
+            await execute_async(insert, tuple(
+                UNSET_VALUE if value is None else value
+                for value in (
+                    row.room_id, bucket, row.message_id, row.sender_id,
+                    row.receiver_id, row.message_type, row.content,
+                    row.attachment_url, row.file_name, row.file_size,
+                    row.mime_type, row.timestamp, row.written_at,
+                )
+            ))
+            copied += 1
+
+    # Token order keeps each room's rows together and makes the scan
+    # resumable from the last logged token.
+    rows = await execute_async(SimpleStatement(
+        """
+        SELECT token(room_id) AS room_token, room_id, message_id, sender_id,
+            receiver_id, message_type, content, attachment_url, file_name,
+            file_size, mime_type, timestamp, WRITETIME(sender_id) AS written_at
+        FROM direct_messages
+        WHERE token(room_id) >= %s
+        """,
+        fetch_size=fetch_size,
+    ), (from_token,))
+
+    pending = set()
+    token = None
+    rooms = 0
+    async for row in rows:
+        if row.room_token != token:
+            token = row.room_token
+            rooms += 1
+            if rooms % 1000 == 0:
+                # Everything before this room is written; safe to resume here
+                await asyncio.gather(*pending)
+                pending = set()
+                logger.info(f'Copied {copied} messages, resume with --from-token {token}')
+
+        pending.add(asyncio.create_task(copy(row)))
+        if len(pending) >= concurrency * 4:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+    if pending:
+        await asyncio.gather(*pending)
+
+    logger.info(f'Migrated {copied} direct messages')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--from-token', type=int, default=_MIN_TOKEN)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+    asyncio.run(migrate(args.from_token, args.concurrency))
@@ -0,0 +1,90 @@
+"""Production entrypoint: N uvicorn workers sharing one listening socket.
+
+    python -m app.server
+
+Each worker runs its own event loop (uvloop) and HTTP parser
+(httptools). Engine.IO long-polling needs every request of a session to
+reach the same worker, which a shared socket can't guarantee, so with
+more than one worker the Socket.IO server only accepts websocket
+transport and no sticky sessions are needed.
+"""
+import asyncio
+import os
+import socket
+from typing import List, Optional
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger('server')
+
+
+async def drain():
+    # Imported here so the supervisor process doesn't load the app
+    from app.services.write_behind import close_writers
+    from app.sio_server import sio
+
+    logger.info('Draining: asking clients to reconnect elsewhere')
+    await sio.emit(
+        'server_shutdown',
+        {'reconnect': True, 'retry_after_ms': int(settings.SERVER_DRAIN_RETRY_AFTER * 1000)},
+        ignore_queue=True,
+    )
+    # Let clients move off and in-flight handlers finish their writes
+    await asyncio.sleep(settings.SERVER_DRAIN_GRACE_PERIOD)
+    await close_writers()
+
+
+class DrainingServer(uvicorn.Server):
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None):
+        # Stop accepting first; the base class repeats this harmlessly
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        try:
+            await drain()
+        except Exception:
+            logger.exception('Drain failed')
+        await super().shutdown(sockets)
+
+
+def get_worker_count() -> int:
+    return settings.SERVER_WORKERS or os.cpu_count() or 1
+
+
+def main():
+    workers = get_worker_count()
+    if workers > 1 and 'polling' in settings.SIO_TRANSPORTS:
+        # Read by each worker's settings when it imports the app
+        os.environ['SIO_TRANSPORTS'] = 'websocket'
+        logger.info(f'{workers} workers: restricting Socket.IO to websocket transport')
+
+    config = uvicorn.Config(
+        'app.main:app',
+        host=settings.SERVER_HOST,
+        port=settings.SERVER_PORT,
+        workers=workers,
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+        proxy_headers=True,
+        forwarded_allow_ips=settings.SERVER_FORWARDED_ALLOW_IPS,
+    )
+    server = DrainingServer(config)
+
+    if workers == 1:
+        server.run()
+        return
+
+    sock = config.bind_socket()
+    Multiprocess(config, target=server.run, sockets=[sock]).run()
+
+
+if __name__ == '__main__':
+    main()
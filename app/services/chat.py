@@ -1,14 +1,28 @@
 import uuid
 import asyncio
 from datetime import datetime, timezone
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
-from cassandra.util import uuid_from_time
-from cassandra.query import SimpleStatement
-from cassandra import ConsistencyLevel
-
-from app.db.cassandra import get_cassandra_session
-from app.services.user import fetch_member_info
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.config.settings import settings
+from app.services.direct_messages import get_messages_page, insert_direct_message
+from app.services.user import get_member_info, get_members_info
+from app.services.membership import clear_negative_membership, remember_membership
+from app.services.presence import get_online_users
+from app.services.room_cache import known_rooms
+from app.services.unread import get_unread_counts, increment_unread
+from app.services.search import search_index
+from app.services.write_behind import CoalescingWriter
+from app.services.inbox import (
+    add_inbox_entry,
+    from_millis,
+    get_inbox_entries,
+    get_rooms_for_entries,
+    room_activity,
+    to_millis,
+    update_room_last_message,
+)
 
 from app.schemas.data_validators import SendChatMessageValidator
 from app.schemas.data_classes import RoomDetailsParams
@@ -16,43 +30,90 @@ from app.schemas.data_classes import RoomDetailsParams
 from app.utils.logger import get_logger
 
 logger = get_logger('chat')
-session = get_cassandra_session()
+
+
+async def _flush_last_message(key, value):
+    team_id, user_id, room_id = key
+    content, message_type, timestamp = value
+    await update_room_last_message(
+        team_id, user_id, room_id, content, message_type, timestamp
+    )
+
+
+# Coalesces last_message updates per (team_id, user_id, room_id); in a
+# busy room only the newest message within the window is written.
+last_message_writer = CoalescingWriter(
+    'last_message',
+    _flush_last_message,
+    window=settings.LAST_MESSAGE_WRITE_BEHIND_WINDOW,
+    merge=lambda old, new: new if new[2] >= old[2] else old,
+)
+
+
+def get_room_team_id(room_id: str) -> str:
+    # Direct rooms are named room_{team_id}_{user1_id}_{user2_id}
+    parts = room_id.split('_')
+    if len(parts) != 4 or parts[0] != 'room':
+        raise ValueError(f'Invalid room_id: {room_id}')
+    return parts[1]
+
+
+async def _write_room_mappings(team_id: str, room_id: str, users: List[str], created_at):
+    # Insert the room mapping and inbox entry for both users. The last
+    # user's mapping goes in last; once it exists the room is complete.
+    for user_id, participant_id in [(users[0], users[1]), (users[1], users[0])]:
+        await execute_async(
+            get_statement('insert_user_chat'), (
+                team_id, 
+                room_id, 
+                user_id, 
+                participant_id, 
+                created_at
+            )
+        )
+        await add_inbox_entry(team_id, user_id, room_id, created_at)
+        remember_membership(team_id, user_id, room_id, participant_id)
+    await known_rooms.remember(team_id, room_id)
+
 
 async def create_or_get_chat_room(team_id: str, user1_id: str, user2_id: str, cookies: Dict) -> str:
     try:
         users = sorted([user1_id, user2_id])
         room_id = f'room_{team_id}_{users[0]}_{users[1]}'
-        applied = session.execute(
-            """
-            INSERT INTO chat_rooms (team_id, room_id, user1_id, user2_id, created_at)
-            VALUES (%s, %s, %s, %s, %s)
-            IF NOT EXISTS
-            """, 
-            (team_id, room_id, users[0], users[1], datetime.now(timezone.utc))
-        ).was_applied
-
-        if applied:
-            resp = await fetch_member_info(team_id, user2_id, cookies)
-            if not resp:
-                raise ValueError(
-                    'Could not verify participant team membership (user_id, {user2_id})'
-                )
-            
-            # Insert the room mapping for both users
-            for user_id, participant_id in [(users[0], users[1]), (users[1], users[0])]:
-                await asyncio.to_thread(session.execute,
-                    """
-                    INSERT INTO user_chats_by_user (
-                        team_id, room_id, user_id, participant_id, created_at
-                    )
-                    VALUES (%s, %s, %s, %s, %s)
-                    """, (
-                        team_id, 
-                        room_id, 
-                        user_id, 
-                        participant_id, 
-                        datetime.now(timezone.utc)
-                    )
+        if await known_rooms.is_known(team_id, room_id, users[1]):
+            # Another node may have created it after we cached a miss
+            for user_id in users:
+                clear_negative_membership(team_id, user_id, room_id)
+            return room_id
+
+        resp = await get_member_info(team_id, user2_id, cookies)
+        if not resp:
+            raise ValueError(
+                f'Could not verify participant team membership (user_id, {user2_id})'
+            )
+
+        # The LWT decides which concurrent first start creates the room;
+        # only that caller writes the mappings.
+        created_at = datetime.now(timezone.utc)
+        result = await execute_async(
+            get_statement('insert_chat_room'),
+            (team_id, room_id, users[0], users[1], created_at)
+        )
+
+        if result.was_applied:
+            await _write_room_mappings(team_id, room_id, users, created_at)
+        else:
+            for user_id in users:
+                clear_negative_membership(team_id, user_id, room_id)
+            mapping = (await execute_async(
+                get_statement('select_room_membership'), (team_id, room_id, users[1])
+            )).one()
+            if not mapping:
+                # Either the creator is still writing the mappings or an
+                # older version left the room without them. The inserts are
+                # idempotent with the room's own created_at, so repair it.
+                await _write_room_mappings(
+                    team_id, room_id, users, result.one().created_at
                 )
 
         return room_id
@@ -65,22 +126,93 @@ async def create_or_get_chat_room(team_id: str, user1_id: str, user2_id: str, co
 
 
 async def get_user_rooms(team_id: str, user_id: str, cookies: dict, room_id=None):
-    query = """
-        SELECT room_id, participant_id, last_message, last_message_type, created_at 
-        FROM user_chats_by_user WHERE team_id = %s AND user_id = %s
-    """
-    params = [team_id, user_id]
-
     if room_id:
-        query += ' AND room_id = %s'
-        params.append(room_id)
-    
-    rows = await asyncio.to_thread(session.execute, query, params)
-    
+        result = await execute_async(
+            get_statement('select_user_room'), (team_id, user_id, room_id)
+        )
+    else:
+        result = await execute_async(
+            get_statement('select_user_rooms'), (team_id, user_id)
+        )
+    rows = await result.all()
+    return await _build_rooms(team_id, user_id, cookies, rows)
+
+
+async def get_user_rooms_page(
+    team_id: str,
+    user_id: str,
+    cookies: dict,
+    limit: int,
+    cursor: Optional[Dict[str, Any]] = None,
+    search: Optional[str] = None,
+) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    # Walks the recency-ordered inbox index and only enriches the rooms
+    # that make it onto the page. Returns the rooms and the next cursor.
+    after = None
+    if cursor:
+        try:
+            after = (from_millis(int(cursor['ts'])), str(cursor['room_id']))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('Invalid cursor')
+    search_lower = search.lower() if search else None
+    chunk_size = max(limit + 1, 50) if search_lower else limit + 1
+
+    rooms = []
+    scanned = 0
+    while len(rooms) <= limit and scanned < settings.INBOX_SEARCH_SCAN_LIMIT:
+        entries = await get_inbox_entries(team_id, user_id, chunk_size, after)
+        if not entries:
+            after = None
+            break
+        scanned += len(entries)
+        after = (entries[-1].last_message_timestamp, entries[-1].room_id)
+
+        rows = await get_rooms_for_entries(team_id, user_id, entries)
+        details = await _build_rooms(team_id, user_id, cookies, rows)
+        for row, room in zip(rows, details):
+            if search_lower and not (
+                search_lower in (room['participant_name'] or '').lower()
+                or search_lower in (room['last_message'] or '').lower()
+            ):
+                continue
+            rooms.append((row, room))
+        if len(entries) < chunk_size:
+            after = None
+            break
+
+    next_cursor = None
+    if len(rooms) > limit:
+        rooms = rooms[:limit]
+        last_row = rooms[-1][0]
+        next_cursor = {'ts': to_millis(room_activity(last_row)), 'room_id': last_row.room_id}
+    elif after is not None:
+        # Scan budget ran out; resume from the last entry we looked at
+        next_cursor = {'ts': to_millis(after[0]), 'room_id': after[1]}
+    return [room for _, room in rooms], next_cursor
+
+
+async def _build_rooms(team_id: str, user_id: str, cookies: dict, rows: List[Any]):
+    # Resolve every participant up front with one batched lookup; the
+    # per-room tasks below then hit the member cache.
+    async with asyncio.TaskGroup() as tg:
+        tg.create_task(
+            get_members_info(team_id, [row.participant_id for row in rows], cookies)
+        )
+        unread_counts_task = tg.create_task(get_unread_counts(team_id, user_id))
+        online_task = tg.create_task(
+            get_online_users(row.participant_id for row in rows)
+        )
+    unread_counts = unread_counts_task.result()
+    online = online_task.result()
+
     async with asyncio.TaskGroup() as tg:
         tasks = [
             tg.create_task(
-                get_room_details(RoomDetailsParams.from_row(row, team_id, user_id, cookies))
+                get_room_details(RoomDetailsParams.from_row(
+                    row, team_id, user_id, cookies,
+                    unread_count=unread_counts.get(row.room_id, 0),
+                    is_participant_online=row.participant_id in online,
+                ))
             )
             for row in rows
         ]
@@ -90,32 +222,25 @@ async def get_user_rooms(team_id: str, user_id: str, cookies: dict, room_id=None
 
 async def get_room_details(params: RoomDetailsParams) -> Dict[str, Any]:
     try:
-        async with asyncio.TaskGroup() as tg:
-            participant_info_task = tg.create_task(
-                fetch_member_info(params.team_id, params.participant_id, params.cookies)
-            )
-            unread_count_task = tg.create_task(
-                get_unread_messages_count(params.team_id, params.room_id, params.user_id)
-            )
-        
-        participant_info = participant_info_task.result()
-        unread_count = unread_count_task.result()
+        participant = await get_member_info(
+            params.team_id, params.participant_id, params.cookies
+        )
         
-        if not participant_info or not isinstance(participant_info, list):
+        if not participant or not isinstance(participant, dict):
             raise ValueError('Participant info not found or invalid format')
         
-        participant = participant_info[0]
-        
         return {
             'room_id': params.room_id,
             'participant_id': params.participant_id,
             'participant_name': participant['display_name'],
-            'is_participant_online': participant.get('online', False),
+            'is_participant_online': params.is_participant_online,
             'participant_profile_pic': participant.get('profile_picture_url', ''),
             'last_message': params.last_message,
             'last_message_type': params.last_message_type,
-            'unread_messages_count': unread_count if unread_count is not None else 0,
-            'created_at': params.created_at.isoformat(),
+            # datetimes are left to the serializer (orjson / msgpack)
+            'last_message_timestamp': params.last_message_timestamp,
+            'unread_messages_count': params.unread_count,
+            'created_at': params.created_at,
         }
 
     except ValueError as ve:
@@ -126,72 +251,40 @@ async def get_room_details(params: RoomDetailsParams) -> Dict[str, Any]:
         raise
 
 
-async def get_unread_messages_count(team_id: str, room_id: str, user_id: str) -> int:
-    last_read = await asyncio.to_thread(
-        lambda: session.execute(
-            """
-            SELECT last_read FROM user_chats_by_user WHERE
-            team_id = %s AND room_id = %s AND user_id = %s
-            """, (team_id, room_id, user_id)
-        ).one()
-    )
-
-    if not last_read or not last_read.last_read:
-        last_read_time = datetime.min
-    else:
-        last_read_time = last_read.last_read
-
-    last_read_uuid = uuid_from_time(last_read_time)
-    count_row = await asyncio.to_thread(
-        lambda: session.execute(
-            """
-            SELECT COUNT(*) FROM direct_messages
-            WHERE room_id = %s AND message_id > %s
-            """,
-            (room_id, last_read_uuid)
-        ).one()
-    )
+async def get_room_messages_page(
+    room_id: str,
+    limit: int,
+    before_id: Optional[uuid.UUID] = None,
+) -> Tuple[List[Any], bool]:
+    # Newest first, straight off the (message_id DESC) clustering order;
+    # with bucketed storage, walking month buckets newest first.
+    return await get_messages_page(room_id, limit, before_id)
 
-    return count_row.count if count_row else 0
-    
 
 async def handle_direct_text_message(user_id, data: SendChatMessageValidator):
     try:
         message_id = uuid.uuid1()
         timestamp = datetime.now(timezone.utc)
         room_id = data.room_id
+        team_id = get_room_team_id(room_id)
         receiver_id = data.receiver_id
         content = data.content
         message_type = data.message_type
 
-        insert_stmt = SimpleStatement(
-            """
-            INSERT INTO direct_messages (
-                room_id, message_id, sender_id, receiver_id, 
-                message_type, content, timestamp
+        await insert_direct_message(
+            room_id, message_id, user_id, receiver_id, message_type, content, timestamp
+        )
+
+        for uid in (user_id, receiver_id):
+            last_message_writer.submit(
+                (team_id, uid, room_id), (content, message_type, timestamp)
             )
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            """, consistency_level=ConsistencyLevel.QUORUM)
-        
-        update_stmt = """
-            UPDATE user_chats_by_user
-            SET last_message = %s, last_message_type = %s, last_message_timestamp = %s
-            WHERE user_id = %s AND room_id = %s
-        """
-        
-        async with asyncio.TaskGroup() as tg:
-            tg.create_task(asyncio.to_thread(
-                session.execute,
-                insert_stmt,
-                (room_id, message_id, user_id, receiver_id, message_type, content, timestamp)
-            ))
-
-            for uid in (user_id, receiver_id):
-                tg.create_task(asyncio.to_thread(
-                    session.execute,
-                    update_stmt,
-                    (content, message_type, timestamp, uid, room_id)
-                ))
+
+        await increment_unread(team_id, receiver_id, room_id)
+        search_index.index_message(
+            str(message_id), room_id, team_id, user_id, receiver_id,
+            to_millis(timestamp), content,
+        )
 
         return {
             'room_id': room_id,
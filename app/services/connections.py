@@ -0,0 +1,94 @@
+import sys
+import time
+from typing import Dict, Optional
+
+from app.config.settings import settings
+
+_COOKIE_NAMES = frozenset(
+    name.strip() for name in settings.CONNECTION_COOKIE_NAMES.split(',') if name.strip()
+)
+
+
+class ConnectionContext:
+    """Per-socket state, built once on connect and read by every event.
+
+    Only the cookies the backend needs are kept, and the team set is
+    capped, so each connection costs a bounded amount of memory.
+    """
+
+    __slots__ = (
+        'sid',
+        'user_id',
+        'teams',
+        'cookies',
+        'connected_at',
+        'events',
+        'messages_sent',
+        'inflight',
+        'throttled',
+    )
+
+    def __init__(self, sid: str, user_id: str, cookies: Dict[str, str]):
+        self.sid = sid
+        self.user_id = user_id
+        self.teams = set()
+        self.cookies = cookies
+        self.connected_at = time.time()
+        self.events = 0
+        self.messages_sent = 0
+        self.inflight = 0
+        self.throttled = 0
+
+    def add_team(self, team_id: str):
+        if len(self.teams) < settings.CONNECTION_MAX_TEAMS:
+            self.teams.add(team_id)
+
+    def footprint(self) -> int:
+        size = sys.getsizeof(self) + sys.getsizeof(self.teams) + sys.getsizeof(self.cookies)
+        size += sum(sys.getsizeof(team) for team in self.teams)
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in self.cookies.items())
+        return size + sys.getsizeof(self.user_id)
+
+
+def filter_cookies(cookies: Dict[str, str]) -> Dict[str, str]:
+    return {
+        name: value
+        for name, value in cookies.items()
+        if name in _COOKIE_NAMES and len(value) <= settings.CONNECTION_MAX_COOKIE_SIZE
+    }
+
+
+_connections: Dict[str, ConnectionContext] = {}
+
+
+def add_connection(sid: str, user_id: str, cookies: Dict[str, str]) -> ConnectionContext:
+    context = ConnectionContext(sid, user_id, filter_cookies(cookies))
+    _connections[sid] = context
+    return context
+
+
+def get_connection(sid: str) -> Optional[ConnectionContext]:
+    return _connections.get(sid)
+
+
+def remove_connection(sid: str) -> Optional[ConnectionContext]:
+    return _connections.pop(sid, None)
+
+
+def get_connection_stats() -> Dict[str, int]:
+    total = sum(context.footprint() for context in list(_connections.values()))
+    count = len(_connections)
+    return {
+        'connections': count,
+        'total_bytes': total + sys.getsizeof(_connections),
+        'avg_bytes_per_connection': total // count if count else 0,
+    }
+
+
+def iter_connections():
+    return list(_connections.values())
+
+
+def user_room(user_id: str) -> str:
+    # Socket.IO room holding every socket of a user, across devices
+    return f'user:{user_id}'
@@ -0,0 +1,126 @@
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from cassandra.query import UNSET_VALUE
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.bucketed import BucketedTable
+from app.db.statements import get_statement
+
+# Every read and write of direct messages goes through here, so the
+# storage layout can be switched with DIRECT_MESSAGES_STORAGE:
+#   legacy   - direct_messages, one partition per room
+#   dual     - writes go to both layouts, reads to legacy
+#   bucketed - direct_messages_by_bucket only
+# Rollout: deploy in dual, run app.scripts.migrate_direct_messages, then
+# switch to bucketed.
+
+DIRECT_MESSAGES = BucketedTable(
+    unit=settings.DIRECT_MESSAGE_BUCKET,
+    insert_bucket='insert_direct_message_bucket',
+    select_buckets='select_direct_message_buckets',
+    select_page='select_bucketed_messages_page',
+    select_page_before='select_bucketed_messages_page_before',
+    select_page_after='select_bucketed_messages_after',
+    count_after='count_bucketed_messages_after',
+)
+
+
+def _writes_legacy() -> bool:
+    return settings.DIRECT_MESSAGES_STORAGE != 'bucketed'
+
+
+def _writes_bucketed() -> bool:
+    return settings.DIRECT_MESSAGES_STORAGE != 'legacy'
+
+
+def _reads_bucketed() -> bool:
+    return settings.DIRECT_MESSAGES_STORAGE == 'bucketed'
+
+
+async def _insert_bucketed(room_id, message_id, sender_id, receiver_id,
+                           message_type, content, timestamp):
+    bucket = DIRECT_MESSAGES.bucket_of(message_id)
+    await DIRECT_MESSAGES.remember_bucket(room_id, bucket)
+    await execute_async(
+        get_statement('insert_bucketed_direct_message'),
+        (room_id, bucket, message_id, sender_id, receiver_id,
+         message_type, UNSET_VALUE if content is None else content, timestamp)
+    )
+
+
+async def insert_direct_message(
+    room_id: str,
+    message_id: uuid.UUID,
+    sender_id: str,
+    receiver_id: str,
+    message_type: str,
+    content: Optional[str],
+    timestamp: datetime,
+):
+    params = (room_id, message_id, sender_id, receiver_id, message_type, content, timestamp)
+    writes = []
+    if _writes_legacy():
+        writes.append(execute_async(get_statement('insert_direct_message'), params))
+    if _writes_bucketed():
+        writes.append(_insert_bucketed(*params))
+    await asyncio.gather(*writes)
+
+
+async def get_messages_page(
+    room_id: str,
+    limit: int,
+    before_id: Optional[uuid.UUID] = None,
+) -> Tuple[List[Any], bool]:
+    # Newest first. One extra row tells us whether an older page exists.
+    if _reads_bucketed():
+        return await DIRECT_MESSAGES.read_page(room_id, limit, before_id)
+
+    if before_id is None:
+        result = await execute_async(
+            get_statement('select_room_messages_page'), (room_id, limit + 1)
+        )
+    else:
+        result = await execute_async(
+            get_statement('select_room_messages_page_before'),
+            (room_id, before_id, limit + 1)
+        )
+    rows = result.current_rows
+    return rows[:limit], len(rows) > limit
+
+
+async def get_messages_after(room_id: str, after_id: uuid.UUID, limit: int) -> List[Any]:
+    # The newest `limit` messages after after_id, newest first
+    if _reads_bucketed():
+        return [row async for row in DIRECT_MESSAGES.iter_after(room_id, after_id, limit)]
+
+    return (await execute_async(
+        get_statement('select_room_messages_after_page'), (room_id, after_id, limit)
+    )).current_rows
+
+
+async def iter_messages_after(room_id: str, after_id: uuid.UUID) -> AsyncIterator[Any]:
+    # Every message after after_id, newest first, fetched page by page
+    if _reads_bucketed():
+        async for row in DIRECT_MESSAGES.iter_after(room_id, after_id):
+            yield row
+        return
+
+    rows = await execute_async(
+        get_statement('select_room_messages_after'), (room_id, after_id)
+    )
+    async for row in rows:
+        yield row
+
+
+async def count_messages_after(room_id: str, after_id: uuid.UUID) -> int:
+    if _reads_bucketed():
+        return await DIRECT_MESSAGES.count_rows_after(room_id, after_id)
+
+    row = (await execute_async(
+        get_statement('count_unread_messages'), (room_id, after_id)
+    )).one()
+    return row.count if row else 0
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from app.config.settings import settings
+from app.services.connections import ConnectionContext
+from app.sio_server import sio
+from app.utils.cache import TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger('ephemeral')
+
+# Typing and similar presence-in-room signals. Nothing here is persisted
+# or goes through the durable message handlers: a signal is checked
+# against the sender's local rooms, throttled, and forwarded to the other
+# sids in the room. Indicators carry a TTL and are also stopped by the
+# server if not refreshed.
+
+KINDS = frozenset(('typing', 'stop_typing', 'recording', 'stop_recording'))
+_STOPS = {'typing': 'stop_typing', 'recording': 'stop_recording'}
+
+_last_sent = TTLCache(maxsize=settings.EPHEMERAL_CACHE_MAXSIZE, ttl=60)
+_expiry: Dict[Tuple[str, str, str], asyncio.TimerHandle] = {}
+# Server-sent stops still being emitted; the loop only holds weak references
+_stop_tasks: Set[asyncio.Task] = set()
+
+metrics: Dict[str, Any] = {
+    'received': 0,
+    'forwarded': 0,
+    'throttled': 0,
+    'dropped': 0,
+    'rejected': 0,
+    'expired': 0,
+    'handler_seconds': 0.0,
+}
+
+
+def _parse(data: Any) -> Optional[Tuple[str, str]]:
+    # Compact schema: {"room_id": str, "kind": one of KINDS}
+    if not isinstance(data, dict):
+        return None
+    room_id, kind = data.get('room_id'), data.get('kind')
+    if not isinstance(room_id, str) or len(room_id) > 40 or kind not in KINDS:
+        return None
+    return room_id, kind
+
+
+async def _forward(room_id: str, user_id: str, kind: str, skip_sid: Optional[str] = None):
+    metrics['forwarded'] += 1
+    await sio.emit('activity', {
+        'room_id': room_id,
+        'user_id': user_id,
+        'kind': kind,
+        'ttl_ms': int(settings.EPHEMERAL_TTL * 1000),
+    }, room=room_id, skip_sid=skip_sid)
+
+
+def _expire(key: Tuple[str, str, str]):
+    _expiry.pop(key, None)
+    _last_sent.pop(key)
+    user_id, room_id, kind = key
+    metrics['expired'] += 1
+    task = asyncio.create_task(_forward(room_id, user_id, _STOPS[kind]))
+    _stop_tasks.add(task)
+    task.add_done_callback(_stop_done)
+
+
+def _stop_done(task: asyncio.Task):
+    _stop_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f'Could not send expired activity stop: {task.exception()!r}')
+
+
+def _schedule_expiry(key: Tuple[str, str, str]):
+    handle = _expiry.pop(key, None)
+    if handle is not None:
+        handle.cancel()
+    _expiry[key] = asyncio.get_running_loop().call_later(
+        settings.EPHEMERAL_TTL, _expire, key
+    )
+
+
+async def handle_activity(sid: str, context: ConnectionContext, data: Any):
+    started = time.perf_counter()
+    metrics['received'] += 1
+    try:
+        parsed = _parse(data)
+        # Only rooms this socket has joined (via start_chat) are allowed
+        if parsed is None or parsed[0] not in sio.rooms(sid):
+            metrics['rejected'] += 1
+            return
+        room_id, kind = parsed
+        user_id = context.user_id
+
+        if kind in _STOPS:
+            key = (user_id, room_id, kind)
+            now = time.monotonic()
+            last = _last_sent.get(key)
+            _schedule_expiry(key)
+            if last is not None and now - last < settings.EPHEMERAL_THROTTLE:
+                metrics['throttled'] += 1
+                return
+            _last_sent.set(key, now)
+        else:
+            start_kind = next(k for k, stop in _STOPS.items() if stop == kind)
+            key = (user_id, room_id, start_kind)
+            handle = _expiry.pop(key, None)
+            if handle is None:
+                # Nothing was showing; no need to clear it
+                metrics['dropped'] += 1
+                return
+            handle.cancel()
+            _last_sent.pop(key)
+
+        await _forward(room_id, user_id, kind, skip_sid=sid)
+    finally:
+        metrics['handler_seconds'] += time.perf_counter() - started
+
+
+async def clear_user_activity(user_id: str):
+    # On disconnect: stop the user's indicators now rather than leaving
+    # timers to fire after a reconnect
+    keys = [key for key in _expiry if key[0] == user_id]
+    for key in keys:
+        _expiry.pop(key).cancel()
+        _last_sent.pop(key)
+    await asyncio.gather(*(
+        _forward(room_id, user_id, _STOPS[kind]) for _, room_id, kind in keys
+    ))
+
+
+def get_ephemeral_metrics() -> Dict[str, Any]:
+    return {**metrics, 'active_indicators': len(_expiry)}
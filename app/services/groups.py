@@ -0,0 +1,372 @@
+import asyncio
+import json
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.bucketed import BucketedTable
+from app.db.redis import get_redis
+from app.db.statements import get_statement
+from app.services.connections import user_room
+from app.services.user import get_members_info
+from app.services.write_behind import CoalescingWriter
+from app.sio_server import sio
+from app.utils.cache import TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger('groups')
+
+GROUP_MESSAGES = BucketedTable(
+    unit=settings.GROUP_MESSAGE_BUCKET,
+    insert_bucket='insert_group_message_bucket',
+    select_buckets='select_group_message_buckets',
+    select_page='select_group_messages_page',
+    select_page_before='select_group_messages_page_before',
+)
+
+
+@dataclass(frozen=True)
+class Group:
+    group_id: uuid.UUID
+    team_id: str
+    name: str
+    members: FrozenSet[str]
+
+
+# group_id -> Group. Membership changes are published on _CHANGES_CHANNEL
+# so every node drops its copy; the TTL only bounds staleness while Redis
+# pub/sub is unavailable.
+_groups = TTLCache(maxsize=settings.GROUP_CACHE_MAXSIZE, ttl=settings.GROUP_CACHE_TTL)
+
+_CHANGES_CHANNEL = 'groups:changes'
+
+
+def group_room(group_id: uuid.UUID) -> str:
+    return f'group:{group_id}'
+
+
+def _unread_key(team_id: str, user_id: str) -> str:
+    return f'unread:groups:{team_id}:{user_id}'
+
+
+async def get_group(group_id: uuid.UUID) -> Optional[Group]:
+    group = _groups.get(group_id)
+    if group is not None:
+        return group
+
+    meta = (await execute_async(
+        get_statement('select_chat_group'), (group_id,)
+    )).one()
+    if not meta:
+        return None
+    rows = await execute_async(get_statement('select_group_members'), (group_id,))
+    members = frozenset([row.user_id async for row in rows])
+
+    group = Group(group_id, meta.team_id, meta.name, members)
+    _groups.set(group_id, group)
+    return group
+
+
+def invalidate_group(group_id: uuid.UUID):
+    _groups.pop(group_id)
+
+
+def _apply_change(group_id: uuid.UUID, removed_user_id: Optional[str] = None):
+    invalidate_group(group_id)
+    if removed_user_id is None or '/' not in sio.manager.rooms:
+        return
+    # Socket rooms are per node: each node drops the user's local sockets
+    room = group_room(group_id)
+    for sid, _ in list(sio.manager.get_participants('/', user_room(removed_user_id))):
+        sio.leave_room(sid, room)
+
+
+async def _publish_change(group_id: uuid.UUID, removed_user_id: Optional[str] = None):
+    _apply_change(group_id, removed_user_id)
+    try:
+        await get_redis().publish(_CHANGES_CHANNEL, json.dumps({
+            'group_id': str(group_id),
+            'removed_user_id': removed_user_id,
+        }))
+    except RedisError as e:
+        logger.warning(f'Could not publish group change for {group_id}: {e}')
+
+
+async def run_group_change_listener():
+    # Applies membership changes made on other nodes
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(_CHANGES_CHANNEL)
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                try:
+                    change = json.loads(message['data'])
+                    _apply_change(uuid.UUID(change['group_id']), change.get('removed_user_id'))
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f'Ignoring malformed group change: {message["data"]!r}')
+        except RedisError as e:
+            logger.warning(f'Group change listener lost redis, retrying: {e}')
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
+
+
+async def _add_members(group_id, team_id, name, user_ids, joined_at):
+    semaphore = asyncio.Semaphore(settings.GROUP_FANOUT_CONCURRENCY)
+
+    async def add(user_id):
+        async with semaphore:
+            await execute_async(
+                get_statement('insert_group_member'),
+                (group_id, user_id, name, joined_at)
+            )
+            await execute_async(
+                get_statement('insert_user_group'),
+                (team_id, user_id, group_id, name, joined_at)
+            )
+
+    await asyncio.gather(*(add(user_id) for user_id in user_ids))
+
+
+async def _verify_team_members(team_id: str, user_ids: List[str], cookies: dict):
+    members = await get_members_info(team_id, user_ids, cookies)
+    missing = [uid for uid in user_ids if not members.get(uid)]
+    if missing:
+        raise ValueError(
+            f"Could not verify team membership (user_ids, {', '.join(missing)})"
+        )
+
+
+async def create_group(
+    team_id: str,
+    creator_id: str,
+    name: str,
+    member_ids: Iterable[str],
+    cookies: dict,
+) -> Group:
+    user_ids = list(dict.fromkeys([creator_id, *member_ids]))
+    if len(user_ids) > settings.GROUP_MAX_MEMBERS:
+        raise ValueError(f'Groups are limited to {settings.GROUP_MAX_MEMBERS} members')
+    await _verify_team_members(team_id, [u for u in user_ids if u != creator_id], cookies)
+
+    group_id = uuid.uuid4()
+    created_at = datetime.now(timezone.utc)
+    await execute_async(
+        get_statement('insert_chat_group'),
+        (group_id, team_id, name, creator_id, created_at)
+    )
+    await _add_members(group_id, team_id, name, user_ids, created_at)
+
+    group = Group(group_id, team_id, name, frozenset(user_ids))
+    _groups.set(group_id, group)
+    await _notify_added(group, user_ids)
+    return group
+
+
+async def add_group_members(group: Group, member_ids: Iterable[str], cookies: dict) -> Group:
+    user_ids = [uid for uid in dict.fromkeys(member_ids) if uid not in group.members]
+    if not user_ids:
+        return group
+    if len(group.members) + len(user_ids) > settings.GROUP_MAX_MEMBERS:
+        raise ValueError(f'Groups are limited to {settings.GROUP_MAX_MEMBERS} members')
+    await _verify_team_members(group.team_id, user_ids, cookies)
+
+    await _add_members(
+        group.group_id, group.team_id, group.name, user_ids, datetime.now(timezone.utc)
+    )
+    await _publish_change(group.group_id)
+    group = Group(group.group_id, group.team_id, group.name, group.members | set(user_ids))
+    await _notify_added(group, user_ids)
+    return group
+
+
+async def leave_group(group: Group, user_id: str):
+    await execute_async(
+        get_statement('delete_group_member'), (group.group_id, user_id)
+    )
+    await execute_async(
+        get_statement('delete_user_group'), (group.team_id, user_id, group.group_id)
+    )
+    await _publish_change(group.group_id, removed_user_id=user_id)
+    await sio.emit(
+        'group_removed', {'group_id': str(group.group_id)}, room=user_room(user_id)
+    )
+    try:
+        await get_redis().hdel(_unread_key(group.team_id, user_id), str(group.group_id))
+    except RedisError as e:
+        logger.warning(f'Could not clear group unread counter: {e}')
+
+
+async def _notify_added(group: Group, user_ids: List[str]):
+    # Socket rooms are per node, so clients join the group room themselves
+    # (join_groups) when told about it.
+    payload = {'group_id': str(group.group_id), 'team_id': group.team_id, 'name': group.name}
+    await asyncio.gather(*(
+        sio.emit('group_added', payload, room=user_room(uid)) for uid in user_ids
+    ))
+
+
+async def get_user_groups(team_id: str, user_id: str) -> List[Dict[str, Any]]:
+    rows = await (await execute_async(
+        get_statement('select_user_groups'), (team_id, user_id)
+    )).all()
+    unread = await get_group_unread_counts(team_id, user_id)
+
+    groups = [
+        {
+            'group_id': row.group_id,
+            'name': row.group_name,
+            'joined_at': row.joined_at,
+            'last_message': row.last_message,
+            'last_message_type': row.last_message_type,
+            'last_message_timestamp': row.last_message_timestamp,
+            'last_sender_id': row.last_sender_id,
+            'unread_messages_count': unread.get(str(row.group_id), 0),
+        }
+        # A fan-out racing a leave can recreate a partial row; skip those
+        for row in rows if row.joined_at is not None
+    ]
+    groups.sort(
+        key=lambda g: g['last_message_timestamp'] or g['joined_at'], reverse=True
+    )
+    return groups
+
+
+async def get_group_unread_counts(team_id: str, user_id: str) -> Dict[str, int]:
+    try:
+        counts = await get_redis().hgetall(_unread_key(team_id, user_id))
+    except RedisError as e:
+        logger.warning(f'Group unread counters unavailable: {e}')
+        return {}
+    return {group_id: max(int(count), 0) for group_id, count in counts.items()}
+
+
+async def mark_group_read(group: Group, user_id: str):
+    try:
+        await get_redis().hset(_unread_key(group.team_id, user_id), str(group.group_id), 0)
+    except RedisError as e:
+        logger.warning(f'Could not reset group unread counter: {e}')
+
+
+async def get_group_messages_page(
+    group_id: uuid.UUID,
+    limit: int,
+    before_id: Optional[uuid.UUID] = None,
+) -> Tuple[List[Any], bool]:
+    return await GROUP_MESSAGES.read_page(group_id, limit, before_id)
+
+
+# Fan-out to members is write-behind and coalesced per group: one flush
+# per window covers every message sent to the group in that window.
+
+@dataclass(frozen=True)
+class _Fanout:
+    count: int
+    senders: Dict[str, int]  # sender_id -> messages sent in the window
+
+
+def _merge_fanout(old: _Fanout, new: _Fanout) -> _Fanout:
+    senders = dict(old.senders)
+    for sender, count in new.senders.items():
+        senders[sender] = senders.get(sender, 0) + count
+    return _Fanout(old.count + new.count, senders)
+
+
+def _merge_last(old, new):
+    # (content, message_type, timestamp, sender_id); newest wins
+    return new if new[2] >= old[2] else old
+
+
+async def _flush_unread(group_id: uuid.UUID, fanout: _Fanout):
+    group = await get_group(group_id)
+    if group is None:
+        return
+    field = str(group_id)
+    members = list(group.members)
+    size = settings.GROUP_FANOUT_PIPELINE_SIZE
+    for start in range(0, len(members), size):
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for user_id in members[start:start + size]:
+                # Messages a member sent themselves don't count as unread
+                count = fanout.count - fanout.senders.get(user_id, 0)
+                if count > 0:
+                    pipe.hincrby(_unread_key(group.team_id, user_id), field, count)
+            await pipe.execute()
+
+
+async def _flush_last_message(group_id: uuid.UUID, last):
+    group = await get_group(group_id)
+    if group is None:
+        return
+    content, message_type, timestamp, sender_id = last
+    # Written with the message time so a late flush never moves it back
+    micros = int(timestamp.timestamp() * 1_000_000)
+    statement = get_statement('update_user_group_last_message')
+    semaphore = asyncio.Semaphore(settings.GROUP_FANOUT_CONCURRENCY)
+
+    async def update(user_id):
+        async with semaphore:
+            await execute_async(statement, (
+                micros, content, message_type, timestamp, sender_id,
+                group.team_id, user_id, group_id,
+            ))
+
+    await asyncio.gather(*(update(user_id) for user_id in group.members))
+
+
+# Counters are not idempotent, so they get their own writer: a failed
+# Cassandra fan-out is retried without counting the messages twice.
+group_unread_writer = CoalescingWriter(
+    'group_unread',
+    _flush_unread,
+    window=settings.GROUP_FANOUT_WINDOW,
+    merge=_merge_fanout,
+    max_attempts=1,
+)
+
+group_last_message_writer = CoalescingWriter(
+    'group_last_message',
+    _flush_last_message,
+    window=settings.GROUP_FANOUT_WINDOW,
+    merge=_merge_last,
+)
+
+
+async def send_group_message(
+    group: Group,
+    sender_id: str,
+    content: str,
+    message_type: str,
+) -> Dict[str, Any]:
+    message_id = uuid.uuid1()
+    timestamp = datetime.now(timezone.utc)
+    bucket = GROUP_MESSAGES.bucket_of(message_id)
+
+    await GROUP_MESSAGES.remember_bucket(group.group_id, bucket)
+    await execute_async(
+        get_statement('insert_group_message'),
+        (group.group_id, bucket, message_id, sender_id, message_type, content, timestamp)
+    )
+
+    group_unread_writer.submit(
+        group.group_id, _Fanout(1, {sender_id: 1})
+    )
+    group_last_message_writer.submit(
+        group.group_id, (content, message_type, timestamp, sender_id)
+    )
+
+    return {
+        'group_id': str(group.group_id),
+        'message_id': str(message_id),
+        'sender_id': sender_id,
+        'content': content,
+        'message_type': message_type,
+        'timestamp': timestamp.isoformat(timespec='seconds'),
+    }
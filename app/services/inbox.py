@@ -0,0 +1,133 @@
+import asyncio
+import calendar
+from datetime import datetime, timezone
+from typing import Any, List, Optional, Tuple
+
+from cassandra.query import BatchStatement
+
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.utils.logger import get_logger
+
+logger = get_logger('inbox')
+
+# user_inbox_by_user orders a user's rooms by last activity. Each room has
+# exactly one entry keyed by (last_message_timestamp, room_id); moving a
+# room to the top deletes the old entry and inserts a new one. Entries and
+# last_message are written with the activity time as their write
+# timestamp, so flushes from different nodes can land in any order.
+
+
+def to_millis(dt: datetime) -> int:
+    return calendar.timegm(dt.utctimetuple()) * 1000 + dt.microsecond // 1000
+
+
+def to_micros(dt: datetime) -> int:
+    return calendar.timegm(dt.utctimetuple()) * 1_000_000 + dt.microsecond
+
+
+def from_millis(ms: int) -> datetime:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc)
+
+
+def room_activity(row: Any) -> Optional[datetime]:
+    return row.last_message_timestamp or row.created_at
+
+
+async def add_inbox_entry(team_id: str, user_id: str, room_id: str, created_at: datetime):
+    await execute_async(
+        get_statement('insert_inbox_entry'),
+        (team_id, user_id, created_at, room_id, to_micros(created_at))
+    )
+
+
+async def update_room_last_message(
+    team_id: str,
+    user_id: str,
+    room_id: str,
+    content: Optional[str],
+    message_type: str,
+    timestamp: datetime,
+):
+    prev = (await execute_async(
+        get_statement('select_room_activity'), (team_id, user_id, room_id)
+    )).one()
+    prev_activity = room_activity(prev) if prev else None
+    if prev_activity and to_millis(prev_activity) > to_millis(timestamp):
+        # Another node already wrote a newer message; don't delete its entry
+        return
+
+    batch = BatchStatement()
+    # A delete and insert of the same row in one batch share a write
+    # timestamp, and the delete would win.
+    if prev_activity and to_millis(prev_activity) != to_millis(timestamp):
+        batch.add(
+            get_statement('delete_inbox_entry'),
+            (team_id, user_id, prev_activity, room_id)
+        )
+    micros = to_micros(timestamp)
+    batch.add(
+        get_statement('insert_inbox_entry'),
+        (team_id, user_id, timestamp, room_id, micros)
+    )
+    batch.add(
+        get_statement('update_last_message'),
+        (micros, content, message_type, timestamp, team_id, user_id, room_id)
+    )
+    await execute_async(batch)
+
+
+async def get_inbox_entries(
+    team_id: str,
+    user_id: str,
+    limit: int,
+    after: Optional[Tuple[datetime, str]] = None,
+) -> List[Any]:
+    # Most recent first, starting strictly after the (timestamp, room_id)
+    # position `after`.
+    if after is None:
+        result = await execute_async(
+            get_statement('select_inbox_page'), (team_id, user_id, limit)
+        )
+    else:
+        result = await execute_async(
+            get_statement('select_inbox_page_after'),
+            (team_id, user_id, after[0], after[1], limit)
+        )
+    return result.current_rows
+
+
+async def get_rooms_for_entries(team_id: str, user_id: str, entries: List[Any]) -> List[Any]:
+    """Load the user_chats_by_user rows behind a page of index entries.
+
+    Entries older than the room's last activity were left behind by
+    racing updates; they are dropped from the result and deleted.
+    """
+    results = await asyncio.gather(*(
+        execute_async(
+            get_statement('select_user_room'), (team_id, user_id, entry.room_id)
+        )
+        for entry in entries
+    ))
+
+    rows = []
+    stale = []
+    for entry, result in zip(entries, results):
+        row = result.one()
+        activity = room_activity(row) if row else None
+        entry_ms = to_millis(entry.last_message_timestamp)
+        if activity is None or to_millis(activity) > entry_ms:
+            stale.append(entry)
+        elif to_millis(activity) == entry_ms:
+            rows.append(row)
+        # else: the room row hasn't caught up with a newer entry yet
+
+    if stale:
+        await asyncio.gather(*(
+            execute_async(
+                get_statement('delete_inbox_entry'),
+                (team_id, user_id, entry.last_message_timestamp, entry.room_id)
+            )
+            for entry in stale
+        ), return_exceptions=True)
+    return rows
@@ -0,0 +1,55 @@
+from typing import Optional
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.utils.cache import TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger('membership')
+
+_NOT_A_MEMBER = ''
+
+# (team_id, user_id, room_id) -> participant_id, or _NOT_A_MEMBER for
+# negative results, which are kept for a shorter time.
+_memberships = TTLCache(
+    maxsize=settings.MEMBERSHIP_CACHE_MAXSIZE,
+    ttl=settings.MEMBERSHIP_CACHE_TTL,
+)
+
+
+async def get_room_participant(team_id: str, user_id: str, room_id: str) -> Optional[str]:
+    """Return the other user of a room `user_id` belongs to, else None."""
+    key = (team_id, user_id, room_id)
+    participant_id = _memberships.get(key)
+    if participant_id is not None:
+        return participant_id or None
+
+    row = (await execute_async(
+        get_statement('select_room_membership'), (team_id, room_id, user_id)
+    )).one()
+    if row:
+        _memberships.set(key, row.participant_id)
+        return row.participant_id
+
+    _memberships.set(key, _NOT_A_MEMBER, ttl=settings.MEMBERSHIP_CACHE_NEGATIVE_TTL)
+    return None
+
+
+async def is_room_member(team_id: str, user_id: str, room_id: str) -> bool:
+    return await get_room_participant(team_id, user_id, room_id) is not None
+
+
+def remember_membership(team_id: str, user_id: str, room_id: str, participant_id: str):
+    _memberships.set((team_id, user_id, room_id), participant_id)
+
+
+def invalidate_membership(team_id: str, user_id: str, room_id: str):
+    _memberships.pop((team_id, user_id, room_id))
+
+
+def clear_negative_membership(team_id: str, user_id: str, room_id: str):
+    # Called when a room is (or may just have been) created elsewhere
+    key = (team_id, user_id, room_id)
+    if _memberships.get(key) == _NOT_A_MEMBER:
+        _memberships.pop(key)
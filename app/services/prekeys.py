@@ -0,0 +1,286 @@
+import asyncio
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from cassandra.query import BatchStatement, BatchType
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.redis import get_redis
+from app.db.statements import get_statement
+from app.services.connections import user_room
+from app.sio_server import sio
+from app.utils.logger import get_logger
+
+logger = get_logger('prekeys')
+
+# Cassandra holds the unused one-time prekeys of a device. Claims pop from
+# a Redis list per device ("{prekey_id}:{prekey}"), refilled from Cassandra
+# when it runs dry. Popped ids go into a "claimed" set until their
+# Cassandra delete is long settled, so a refill can never hand one out
+# twice. Every claim, pooled or not, ends in the same LWT delete, so a key
+# handed out by the Cassandra fallback while Redis flapped is skipped by
+# the pool and vice versa.
+
+_REFILL_LOCK_TTL = 10
+
+_CLAIM = """
+local value = redis.call('LPOP', KEYS[1])
+if not value then
+    return {'', 0}
+end
+redis.call('SADD', KEYS[2], string.match(value, '^(-?%d+):'))
+redis.call('EXPIRE', KEYS[2], ARGV[1])
+return {value, redis.call('LLEN', KEYS[1])}
+"""
+
+_claim_script = None
+
+
+def _key(kind: str, user_id: str, device_id: uuid.UUID) -> str:
+    return f'prekeys:{kind}:{user_id}:{device_id}'
+
+
+async def store_one_time_prekeys(user_id: str, device_id: uuid.UUID, prekeys: Dict[int, str]):
+    # One device is one partition, so unlogged batches stay single-node
+    statement = get_statement('insert_one_time_prekey')
+    items = list(prekeys.items())
+    size = settings.PREKEY_UPLOAD_BATCH_SIZE
+    batches = []
+    for start in range(0, len(items), size):
+        batch = BatchStatement(batch_type=BatchType.UNLOGGED)
+        for prekey_id, prekey in items[start:start + size]:
+            batch.add(statement, (user_id, device_id, prekey_id, prekey))
+        batches.append(batch)
+    await asyncio.gather(*(execute_async(batch) for batch in batches))
+
+    # The next claim reloads the pool with the new keys
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.delete(
+                _key('pool', user_id, device_id),
+                _key('empty', user_id, device_id),
+                _key('low', user_id, device_id),
+            )
+            if prekeys:
+                # Re-uploaded ids are fresh keys, not past claims
+                pipe.srem(_key('claimed', user_id, device_id), *prekeys)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f'Could not reset prekey pool for {user_id}/{device_id}: {e}')
+
+
+async def _load_unused(user_id: str, device_id: uuid.UUID) -> List[Any]:
+    rows = await (await execute_async(
+        get_statement('select_one_time_prekeys'),
+        (user_id, device_id, settings.PREKEY_POOL_REFILL_LIMIT)
+    )).all()
+    return [row for row in rows if not row.used]
+
+
+async def _refill(user_id: str, device_id: uuid.UUID) -> bool:
+    redis = get_redis()
+    pool_key = _key('pool', user_id, device_id)
+    if await redis.exists(_key('empty', user_id, device_id)):
+        return False
+    lock_key = _key('lock', user_id, device_id)
+    if not await redis.set(lock_key, 1, nx=True, ex=_REFILL_LOCK_TTL):
+        # Someone else is refilling; wait until they're done
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + _REFILL_LOCK_TTL
+        while await redis.exists(lock_key) and loop.time() < deadline:
+            await asyncio.sleep(0.02)
+        return await redis.llen(pool_key) > 0
+
+    try:
+        rows = await _load_unused(user_id, device_id)
+        claimed = await redis.smembers(_key('claimed', user_id, device_id))
+        values = [
+            f'{row.prekey_id}:{row.prekey}'
+            for row in rows if str(row.prekey_id) not in claimed
+        ]
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(pool_key)
+            if values:
+                pipe.rpush(pool_key, *values)
+                pipe.expire(pool_key, settings.PREKEY_POOL_TTL)
+            else:
+                pipe.set(_key('empty', user_id, device_id), 1, ex=settings.PREKEY_EMPTY_TTL)
+            await pipe.execute()
+        return bool(values)
+    finally:
+        await redis.delete(lock_key)
+
+
+async def _pop_many(devices: List[Tuple[str, uuid.UUID]]) -> List[Tuple[Optional[str], int]]:
+    # One round trip for every device's claim
+    global _claim_script
+    if _claim_script is None:
+        _claim_script = get_redis().register_script(_CLAIM)
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for user_id, device_id in devices:
+            await _claim_script(
+                keys=[_key('pool', user_id, device_id), _key('claimed', user_id, device_id)],
+                args=[settings.PREKEY_CLAIMED_TTL],
+                client=pipe,
+            )
+        results = await pipe.execute()
+    return [(value or None, int(remaining)) for value, remaining in results]
+
+
+async def _claim_in_cassandra(user_id: str, device_id: uuid.UUID, prekey_id: int) -> bool:
+    # The LWT delete makes each claim exclusive
+    return (await execute_async(
+        get_statement('claim_one_time_prekey'), (user_id, device_id, prekey_id)
+    )).was_applied
+
+
+async def _claim_from_cassandra(user_id: str, device_id: uuid.UUID) -> Optional[Tuple[int, str]]:
+    # Redis is down: claim straight from the table
+    for row in await _load_unused(user_id, device_id):
+        if await _claim_in_cassandra(user_id, device_id, row.prekey_id):
+            return row.prekey_id, row.prekey
+    return None
+
+
+async def _pop_from_pool(
+    devices: List[Tuple[str, uuid.UUID]],
+) -> List[Tuple[Optional[str], int]]:
+    popped = await _pop_many(devices)
+    empty = [i for i, (value, _) in enumerate(popped) if value is None]
+    if empty:
+        refilled = await asyncio.gather(*(_refill(*devices[i]) for i in empty))
+        retry = [i for i, ok in zip(empty, refilled) if ok]
+        if retry:
+            results = await _pop_many([devices[i] for i in retry])
+            for i, result in zip(retry, results):
+                popped[i] = result
+    return popped
+
+
+async def _notify_low(user_id: str, device_id: uuid.UUID, remaining: int):
+    if remaining >= settings.PREKEY_LOW_WATERMARK:
+        return
+    # Once per device until it uploads more keys (or the marker expires)
+    if await get_redis().set(_key('low', user_id, device_id), 1, nx=True, ex=3600):
+        await sio.emit(
+            'prekeys_low',
+            {'device_id': str(device_id), 'remaining': remaining},
+            room=user_room(user_id),
+        )
+
+
+async def claim_one_time_prekeys(
+    devices: List[Tuple[str, uuid.UUID]],
+) -> List[Optional[Tuple[int, str]]]:
+    """Claim one one-time prekey for each (user_id, device_id).
+
+    Returns (prekey_id, prekey) per device, or None where it has run out.
+    """
+    if not devices:
+        return []
+    claimed: List[Optional[Tuple[int, str]]] = [None] * len(devices)
+    remaining = [0] * len(devices)
+    todo = list(range(len(devices)))
+    try:
+        while todo:
+            popped = await _pop_from_pool([devices[i] for i in todo])
+            candidates = []
+            for i, (value, left) in zip(todo, popped):
+                remaining[i] = left
+                if value is not None:
+                    prekey_id, prekey = value.split(':', 1)
+                    candidates.append((i, int(prekey_id), prekey))
+
+            applied = await asyncio.gather(*(
+                _claim_in_cassandra(*devices[i], prekey_id)
+                for i, prekey_id, _ in candidates
+            ), return_exceptions=True)
+            # A key the Cassandra fallback already handed out loses the
+            # LWT; pop the next one for that device
+            todo = []
+            for (i, prekey_id, prekey), ok in zip(candidates, applied):
+                if isinstance(ok, Exception):
+                    # The row may still be there for the fallback or a
+                    # later refill to hand out, so this key is not ours.
+                    # Don't fail the batch; the device just gets no key.
+                    logger.warning(
+                        f'Could not claim prekey {prekey_id} of '
+                        f'{devices[i][0]}/{devices[i][1]}: {ok!r}'
+                    )
+                elif ok:
+                    claimed[i] = (prekey_id, prekey)
+                else:
+                    todo.append(i)
+    except RedisError as e:
+        logger.warning(f'Prekey pool unavailable, claiming from Cassandra: {e}')
+        # Only for devices that haven't claimed a key yet
+        missing = [i for i, claim in enumerate(claimed) if claim is None]
+        results = await asyncio.gather(
+            *(_claim_from_cassandra(*devices[i]) for i in missing)
+        )
+        for i, result in zip(missing, results):
+            claimed[i] = result
+        return claimed
+
+    notified = await asyncio.gather(*(
+        _notify_low(user_id, device_id, left)
+        for (user_id, device_id), left in zip(devices, remaining)
+    ), return_exceptions=True)
+    for result in notified:
+        if isinstance(result, Exception):
+            logger.warning(f'Could not send prekeys_low: {result!r}')
+    return claimed
+
+
+async def claim_one_time_prekey(user_id: str, device_id: uuid.UUID) -> Optional[Tuple[int, str]]:
+    return (await claim_one_time_prekeys([(user_id, device_id)]))[0]
+
+
+def _to_bundle(row: Any, claimed: Optional[Tuple[int, str]]) -> Dict[str, Any]:
+    return {
+        'identity_key': row.identity_key,
+        'registration_id': row.registration_id or 0,
+        'signed_prekey': {
+            'keyId': row.signed_prekey_id,
+            'publicKey': row.signed_prekey,
+            'signature': row.signature
+        },
+        'one_time_prekeys': dict([claimed]) if claimed else {},
+    }
+
+
+async def get_prekey_bundle(user_id: str, device_id: uuid.UUID) -> Optional[Dict[str, Any]]:
+    """Return a device's bundle with one claimed one-time prekey.
+
+    None when the device has no bundle; `one_time_prekeys` is empty when
+    its one-time prekeys have run out.
+    """
+    row = (await execute_async(
+        get_statement('select_prekey_bundle'), (user_id, device_id)
+    )).one()
+    if not row:
+        return None
+
+    claimed = await claim_one_time_prekey(user_id, device_id)
+    return _to_bundle(row, claimed)
+
+
+async def get_users_prekey_bundles(user_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Bundles for every device of each user, one one-time prekey each.
+
+    Device lookups run concurrently and all claims share one Redis round
+    trip.
+    """
+    results = await asyncio.gather(*(
+        execute_async(get_statement('select_user_prekey_bundles'), (user_id,))
+        for user_id in user_ids
+    ))
+    rows = [row for result in results for row in await result.all()]
+    claims = await claim_one_time_prekeys([(row.user_id, row.device_id) for row in rows])
+
+    bundles = {user_id: [] for user_id in user_ids}
+    for row, claimed in zip(rows, claims):
+        bundles[row.user_id].append({'device_id': row.device_id, **_to_bundle(row, claimed)})
+    return bundles
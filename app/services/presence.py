@@ -0,0 +1,164 @@
+import asyncio
+import time
+from typing import Dict, Iterable, Set
+
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.db.redis import get_redis
+from app.services.connections import iter_connections
+from app.services.write_behind import CoalescingWriter
+from app.sio_server import sio
+from app.utils.logger import get_logger
+from app.utils.node import NODE_ID
+
+logger = get_logger('presence')
+
+# presence:{user_id} is a sorted set with one member per live socket
+# ("{node}:{sid}"), scored by the time that socket's heartbeat expires.
+# A user is online while any member has a score in the future, so
+# sockets on a crashed node age out on their own.
+
+
+def _presence_key(user_id: str) -> str:
+    return f'presence:{user_id}'
+
+
+def presence_room(user_id: str) -> str:
+    # Socket.IO room of everyone watching user_id's presence
+    return f'presence:{user_id}'
+
+
+def _member(sid: str) -> str:
+    return f'{NODE_ID}:{sid}'
+
+
+async def mark_online(user_id: str, sid: str) -> bool:
+    """Register a socket. Returns True if the user just came online."""
+    now = time.time()
+    key = _presence_key(user_id)
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zcard(key)
+        pipe.zadd(key, {_member(sid): now + settings.PRESENCE_TTL})
+        pipe.expire(key, int(settings.PRESENCE_TTL * 2))
+        _, live_before, _, _ = await pipe.execute()
+    return live_before == 0
+
+
+async def mark_offline(user_id: str, sid: str) -> bool:
+    """Unregister a socket. Returns True if the user just went offline."""
+    now = time.time()
+    key = _presence_key(user_id)
+    async with get_redis().pipeline(transaction=True) as pipe:
+        pipe.zrem(key, _member(sid))
+        pipe.zremrangebyscore(key, '-inf', now)
+        pipe.zcard(key)
+        removed, _, live_after = await pipe.execute()
+    return bool(removed) and live_after == 0
+
+
+async def get_online_users(user_ids: Iterable[str]) -> Set[str]:
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return set()
+    now = time.time()
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zcount(_presence_key(user_id), now, '+inf')
+            counts = await pipe.execute()
+    except RedisError as e:
+        logger.warning(f'Presence lookup failed: {e}')
+        return set()
+    return {user_id for user_id, count in zip(user_ids, counts) if count}
+
+
+async def is_online(user_id: str) -> bool:
+    return user_id in await get_online_users([user_id])
+
+
+async def heartbeat():
+    connections = iter_connections()
+    if not connections:
+        return
+    expires_at = time.time() + settings.PRESENCE_TTL
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for context in connections:
+            key = _presence_key(context.user_id)
+            pipe.zadd(key, {_member(context.sid): expires_at})
+            pipe.expire(key, int(settings.PRESENCE_TTL * 2))
+        await pipe.execute()
+
+
+async def run_presence_heartbeat():
+    while True:
+        await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+        try:
+            await heartbeat()
+        except RedisError as e:
+            logger.warning(f'Presence heartbeat failed: {e}')
+        except Exception:
+            logger.exception('Presence heartbeat failed')
+
+
+# State watchers last saw for users with a pending notification. A
+# connection that flaps back inside the debounce window sends nothing.
+_baseline: Dict[str, bool] = {}
+
+
+async def _notify(user_id: str, _online: bool):
+    # Re-read rather than trust the submitted value, so the event reflects
+    # the cluster-wide state at send time.
+    baseline = _baseline.pop(user_id, None)
+    online = await is_online(user_id)
+    if online == baseline:
+        return
+    await sio.emit(
+        'presence',
+        {'user_id': user_id, 'online': online},
+        room=presence_room(user_id),
+    )
+
+
+presence_notifier = CoalescingWriter(
+    'presence',
+    _notify,
+    window=settings.PRESENCE_DEBOUNCE,
+)
+
+
+def _changed(user_id: str, online: bool):
+    if not presence_notifier.is_pending(user_id):
+        _baseline[user_id] = not online
+    presence_notifier.submit(user_id, online)
+
+
+async def user_connected(user_id: str, sid: str):
+    try:
+        if await mark_online(user_id, sid):
+            _changed(user_id, True)
+    except RedisError as e:
+        logger.warning(f'Could not mark {user_id} online: {e}')
+
+
+async def user_disconnected(user_id: str, sid: str):
+    try:
+        if await mark_offline(user_id, sid):
+            _changed(user_id, False)
+    except RedisError as e:
+        logger.warning(f'Could not mark {user_id} offline: {e}')
+
+
+async def get_user_nodes(user_ids: Iterable[str]) -> Set[str]:
+    # Nodes holding at least one live socket of any of user_ids
+    now = time.time()
+    async with get_redis().pipeline(transaction=False) as pipe:
+        for user_id in user_ids:
+            pipe.zrangebyscore(_presence_key(user_id), now, '+inf')
+        results = await pipe.execute()
+    return {
+        member.rsplit(':', 1)[0]
+        for members in results
+        for member in members
+    }
@@ -0,0 +1,165 @@
+import functools
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.db.redis import get_redis
+from app.services.connections import get_connection
+from app.sio_server import sio
+from app.utils.cache import TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger('rate_limit')
+
+
+def _parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    # "send_direct_message=10/20,start_chat=1/5" -> {event: (rate/s, burst)}
+    limits = {}
+    for item in spec.split(','):
+        if not item.strip():
+            continue
+        event, _, limit = item.partition('=')
+        rate, _, burst = limit.partition('/')
+        limits[event.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+
+_LIMITS = _parse_limits(settings.RATE_LIMITS)
+_DEFAULT_LIMIT = _parse_limits(f'default={settings.RATE_LIMIT_DEFAULT}')['default']
+
+
+def get_limit(event: str) -> Tuple[float, float]:
+    return _LIMITS.get(event, _DEFAULT_LIMIT)
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def acquire(self, rate: float, burst: float, cost: float = 1.0) -> float:
+        """Take `cost` tokens. Returns 0 on success, else seconds to wait."""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / rate
+
+
+# Same algorithm, shared by every node. Uses the Redis clock so nodes
+# with skewed clocks agree.
+_REDIS_BUCKET = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+_local_buckets = TTLCache(maxsize=settings.RATE_LIMIT_LOCAL_MAXSIZE, ttl=300)
+_script = None
+
+metrics: Dict[str, Dict[str, int]] = defaultdict(
+    lambda: {'allowed': 0, 'throttled': 0, 'busy': 0, 'redis_errors': 0}
+)
+
+
+async def _acquire_shared(user_id: str, event: str, rate: float, burst: float) -> float:
+    global _script
+    if _script is None:
+        _script = get_redis().register_script(_REDIS_BUCKET)
+    return float(await _script(
+        keys=[f'ratelimit:{event}:{user_id}'], args=[rate, burst, 1], client=get_redis()
+    ))
+
+
+async def check_rate_limit(user_id: str, event: str) -> float:
+    """Returns 0 if the event may proceed, else seconds until it may."""
+    rate, burst = get_limit(event)
+    key = (user_id, event)
+    bucket = _local_buckets.get(key)
+    if bucket is None:
+        bucket = TokenBucket(burst)
+        _local_buckets.set(key, bucket)
+
+    # The local bucket turns floods away without a Redis round trip; the
+    # shared one enforces the limit across nodes and devices.
+    wait = bucket.acquire(rate, burst)
+    if wait or not settings.RATE_LIMIT_SHARED:
+        return wait
+    try:
+        return await _acquire_shared(user_id, event, rate, burst)
+    except RedisError as e:
+        metrics[event]['redis_errors'] += 1
+        logger.warning(f'Shared rate limit unavailable, using local only: {e}')
+        return 0.0
+
+
+async def _reject(sid: str, event: str, reason: str, retry_after: Optional[float] = None):
+    await sio.emit('rate_limited', {
+        'event': event,
+        'reason': reason,
+        'retry_after_ms': int((retry_after or 0) * 1000),
+        'code': 429,
+    }, room=sid)
+
+
+def rate_limited(event: str):
+    """Guard a socket event handler with a rate limit and in-flight cap.
+
+    Unauthenticated sids are passed through so the handler can reject
+    them as it already does.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(sid, *args):
+            context = get_connection(sid)
+            if context is None:
+                return await handler(sid, *args)
+
+            if context.inflight >= settings.CONNECTION_MAX_INFLIGHT:
+                metrics[event]['busy'] += 1
+                context.throttled += 1
+                await _reject(sid, event, 'busy')
+                return
+
+            # Reserve the slot before awaiting anything
+            context.inflight += 1
+            try:
+                wait = await check_rate_limit(context.user_id, event)
+                if wait:
+                    metrics[event]['throttled'] += 1
+                    context.throttled += 1
+                    await _reject(sid, event, 'rate', wait)
+                    return
+
+                metrics[event]['allowed'] += 1
+                return await handler(sid, *args)
+            finally:
+                context.inflight -= 1
+        return wrapper
+    return decorator
+
+
+def get_rate_limit_metrics() -> Dict[str, Dict[str, int]]:
+    return {event: dict(counts) for event, counts in metrics.items()}
@@ -0,0 +1,81 @@
+import uuid
+from datetime import datetime, timezone
+
+from cassandra.util import unix_time_from_uuid1
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.services.unread import queue_unread_recount, reset_unread
+from app.services.write_behind import CoalescingWriter
+from app.sio_server import sio
+from app.utils.logger import get_logger
+
+logger = get_logger('receipts')
+
+
+def _micros(dt: datetime) -> int:
+    return int(dt.timestamp() * 1_000_000)
+
+
+async def _flush_last_read(key, value):
+    team_id, user_id, room_id = key
+    last_read, recount = value
+    # The write timestamp is the read position itself, so concurrent
+    # writers (other nodes, other devices) can never move it backwards.
+    await execute_async(
+        get_statement('update_last_read'),
+        (_micros(last_read), last_read, user_id, room_id, team_id)
+    )
+    if recount:
+        # The read position may be behind the newest message (mark_read
+        # of an older one); recount against what was just written.
+        await queue_unread_recount(team_id, user_id, room_id)
+
+
+async def _send_read_receipt(key, message_id: uuid.UUID):
+    team_id, user_id, room_id = key
+    await sio.emit('read_receipt', {
+        'room_id': room_id,
+        'user_id': user_id,
+        'message_id': str(message_id),
+    }, room=room_id)
+
+
+# One last_read write per (team_id, user_id, room_id) per window, however
+# many messages the user scrolled past. Values are (last_read, recount);
+# the newest position wins.
+last_read_writer = CoalescingWriter(
+    'last_read',
+    _flush_last_read,
+    window=settings.LAST_READ_WRITE_BEHIND_WINDOW,
+    merge=max,
+)
+
+# At most one receipt per user and room per interval, carrying the
+# newest watermark
+read_receipt_writer = CoalescingWriter(
+    'read_receipt',
+    _send_read_receipt,
+    window=settings.READ_RECEIPT_INTERVAL,
+    merge=lambda old, new: new if new.time >= old.time else old,
+)
+
+
+async def mark_read(team_id: str, user_id: str, room_id: str, message_id: uuid.UUID):
+    if message_id.version != 1:
+        raise ValueError('message_id must be a time-based UUID')
+    now = datetime.now(timezone.utc)
+    read_at = min(
+        datetime.fromtimestamp(unix_time_from_uuid1(message_id), tz=timezone.utc), now
+    )
+
+    last_read_writer.submit((team_id, user_id, room_id), (read_at, True))
+    read_receipt_writer.submit((team_id, user_id, room_id), message_id)
+    await reset_unread(team_id, user_id, room_id)
+
+
+async def mark_room_read(team_id: str, user_id: str, room_id: str):
+    # Everything up to now, e.g. when the room is opened
+    last_read_writer.submit((team_id, user_id, room_id), (datetime.now(timezone.utc), False))
+    await reset_unread(team_id, user_id, room_id)
@@ -0,0 +1,110 @@
+import asyncio
+
+from cassandra.query import SimpleStatement
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.redis import get_redis
+from app.db.statements import get_statement
+from app.utils.cache import TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger('room_cache')
+
+_WARM_LOCK_KEY = 'rooms:known:warming'
+
+
+def _team_key(team_id: str) -> str:
+    return f'rooms:known:{team_id}'
+
+
+class KnownRoomCache:
+    """Remembers which chat rooms exist so start_chat can skip the LWT.
+
+    Lookups go local LRU -> Redis set per team -> plain read of the
+    room mapping. Only rooms whose creation has fully completed are
+    remembered, so a hit never skips work that still has to be done.
+    """
+
+    def __init__(self):
+        self.local = TTLCache(
+            maxsize=settings.KNOWN_ROOMS_CACHE_MAXSIZE,
+            ttl=settings.KNOWN_ROOMS_CACHE_TTL,
+        )
+
+    async def is_known(self, team_id: str, room_id: str, last_user_id: str) -> bool:
+        # last_user_id is the user whose user_chats_by_user row is written
+        # last on creation; once it exists the room is complete.
+        if self.local.get((team_id, room_id)):
+            return True
+
+        try:
+            if await get_redis().sismember(_team_key(team_id), room_id):
+                self.local.set((team_id, room_id), True)
+                return True
+        except RedisError as e:
+            logger.warning(f'Known-room lookup in redis failed: {e}')
+
+        row = (await execute_async(
+            get_statement('select_room_membership'), (team_id, room_id, last_user_id)
+        )).one()
+        if row:
+            await self.remember(team_id, room_id)
+            return True
+        return False
+
+    async def remember(self, team_id: str, room_id: str):
+        self.local.set((team_id, room_id), True)
+        try:
+            await get_redis().sadd(_team_key(team_id), room_id)
+        except RedisError as e:
+            logger.warning(f'Known-room write to redis failed: {e}')
+
+    async def forget(self, team_id: str, room_id: str):
+        self.local.pop((team_id, room_id))
+        try:
+            await get_redis().srem(_team_key(team_id), room_id)
+        except RedisError as e:
+            logger.warning(f'Known-room removal from redis failed: {e}')
+
+    async def warm(self, batch_size: int = 1000):
+        # One node per cluster copies completed rooms into the Redis sets.
+        # A room counts once its last user's mapping row exists; chat_rooms
+        # alone can hold rooms whose mappings were never written.
+        redis = get_redis()
+        try:
+            if not await redis.set(_WARM_LOCK_KEY, 1, nx=True, ex=3600):
+                return
+        except RedisError as e:
+            logger.warning(f'Skipping known-room warm-up: {e}')
+            return
+
+        warmed = 0
+        rows = await execute_async(SimpleStatement(
+            'SELECT team_id, user_id, room_id FROM user_chats_by_user',
+            fetch_size=batch_size,
+        ))
+        pipe = redis.pipeline(transaction=False)
+        async for row in rows:
+            # Rooms are room_{team_id}_{user1_id}_{user2_id}, users sorted
+            if row.room_id.split('_')[-1] != row.user_id:
+                continue
+            pipe.sadd(_team_key(row.team_id), row.room_id)
+            warmed += 1
+            if warmed % batch_size == 0:
+                await pipe.execute()
+        await pipe.execute()
+        logger.info(f'Warmed {warmed} known rooms')
+
+
+known_rooms = KnownRoomCache()
+
+
+async def warm_known_rooms():
+    try:
+        await known_rooms.warm()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception('Known-room warm-up failed')
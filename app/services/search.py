@@ -0,0 +1,367 @@
+import asyncio
+import os
+import re
+import sqlite3
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from cassandra.util import min_uuid_from_time
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.services.direct_messages import iter_messages_after
+from app.services.inbox import from_millis, room_activity, to_millis
+from app.utils.cache import TTLCache
+from app.utils.logger import get_logger
+
+logger = get_logger('search')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_docs (
+    id INTEGER PRIMARY KEY,
+    message_id TEXT NOT NULL UNIQUE,
+    room_id TEXT NOT NULL,
+    team_id TEXT NOT NULL,
+    sender_id TEXT NOT NULL,
+    receiver_id TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_message_docs_room ON message_docs (room_id);
+CREATE INDEX IF NOT EXISTS idx_message_docs_team ON message_docs (team_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+    content,
+    content='message_docs',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS message_docs_ai AFTER INSERT ON message_docs BEGIN
+    INSERT INTO message_fts (rowid, content) VALUES (new.id, new.content);
+END;
+
+-- Newest message_id copied from Cassandra per room. Live messages are
+-- indexed as they are sent, but only catch-up moves the watermark: live
+-- traffic on an indexed room schedules one in the background, since
+-- other nodes' messages never reach this index live.
+CREATE TABLE IF NOT EXISTS indexed_rooms (
+    room_id TEXT PRIMARY KEY,
+    watermark TEXT NOT NULL,
+    watermark_ms INTEGER NOT NULL
+);
+"""
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match_query(text: str) -> Optional[str]:
+    # Every token must match, each as a prefix: 'hel wor' -> "hel"* "wor"*
+    tokens = _TOKEN_RE.findall(text)
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens[:16])
+
+
+class MessageSearchIndex:
+    """Full-text index of direct messages in a local SQLite FTS5 file.
+
+    All SQLite work runs on one dedicated thread. Writes are queued and
+    flushed in batches. Copying history from Cassandra is capped on the
+    request path; the rest runs as background catch-ups.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='search-index')
+        self._pending: List[tuple] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_flush_task: Optional[asyncio.Task] = None
+        # Held only while a catch-up runs or waits, so idle rooms drop out
+        self._room_locks: 'weakref.WeakValueDictionary[str, asyncio.Lock]' = (
+            weakref.WeakValueDictionary()
+        )
+        # room_id -> running background catch-up
+        self._catch_ups: Dict[str, asyncio.Task] = {}
+        self._catch_up_semaphore = asyncio.Semaphore(settings.SEARCH_BACKFILL_CONCURRENCY)
+        # Rooms whose live traffic recently scheduled a catch-up
+        self._live_caught_up = TTLCache(
+            maxsize=100_000, ttl=settings.SEARCH_LIVE_CATCH_UP_INTERVAL
+        )
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(_SCHEMA)
+        self._conn = conn
+
+    async def start(self):
+        await self._run(self._open)
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        logger.info(f'Search index opened at {self.path}')
+
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._batch_flush_task is not None:
+            await self._batch_flush_task
+            self._batch_flush_task = None
+        await self.flush()
+        for task in list(self._catch_ups.values()):
+            task.cancel()
+        if self._conn is not None:
+            await self._run(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+    def index_message(
+        self,
+        message_id: str,
+        room_id: str,
+        team_id: str,
+        sender_id: str,
+        receiver_id: str,
+        ts_ms: int,
+        content: Optional[str],
+    ):
+        if not content or self._conn is None:
+            return
+        self._pending.append(
+            (message_id, room_id, team_id, sender_id, receiver_id, ts_ms, content)
+        )
+        if len(self._pending) >= settings.SEARCH_INDEX_BATCH_SIZE and (
+            self._batch_flush_task is None or self._batch_flush_task.done()
+        ):
+            self._batch_flush_task = asyncio.create_task(self.flush())
+
+    def _write(self, docs: List[tuple], watermark: Optional[tuple] = None):
+        with self._conn:
+            self._conn.executemany(
+                """
+                INSERT OR IGNORE INTO message_docs (
+                    message_id, room_id, team_id, sender_id, receiver_id, ts, content
+                ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                docs,
+            )
+            if watermark is not None:
+                self._conn.execute(
+                    """
+                    INSERT INTO indexed_rooms (room_id, watermark, watermark_ms)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (room_id) DO UPDATE SET
+                        watermark = excluded.watermark,
+                        watermark_ms = excluded.watermark_ms
+                    """,
+                    watermark,
+                )
+
+    async def flush(self):
+        if not self._pending or self._conn is None:
+            return
+        docs, self._pending = self._pending, []
+        try:
+            await self._run(self._write, docs)
+        except sqlite3.Error:
+            logger.exception(f'Failed to index {len(docs)} messages')
+
+        for _, room_id, team_id, *_ in docs:
+            if self._live_caught_up.get(room_id) is None:
+                self._live_caught_up.set(room_id, True)
+                self._schedule_catch_up(room_id, team_id, indexed_only=True)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.SEARCH_INDEX_FLUSH_INTERVAL)
+            await self.flush()
+
+    def _get_watermark(self, room_id: str):
+        return self._conn.execute(
+            'SELECT watermark, watermark_ms FROM indexed_rooms WHERE room_id = ?',
+            (room_id,),
+        ).fetchone()
+
+    def _room_lock(self, room_id: str) -> asyncio.Lock:
+        lock = self._room_locks.get(room_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._room_locks[room_id] = lock
+        return lock
+
+    def _get_watermarks(self, room_ids: List[str]) -> Dict[str, int]:
+        watermarks = {}
+        for start in range(0, len(room_ids), 500):
+            chunk = room_ids[start:start + 500]
+            rows = self._conn.execute(
+                'SELECT room_id, watermark_ms FROM indexed_rooms WHERE room_id IN '
+                f'({", ".join("?" * len(chunk))})',
+                chunk,
+            ).fetchall()
+            watermarks.update(rows)
+        return watermarks
+
+    async def catch_up_room(
+        self,
+        room_id: str,
+        team_id: str,
+        up_to_ms: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> bool:
+        """Copy messages this node hasn't seen from Cassandra.
+
+        Only reads what's newer than the room's watermark, newest first.
+        Stops after `limit` messages and returns False if it didn't reach
+        the watermark.
+        """
+        lock = self._room_lock(room_id)
+        async with lock:
+            watermark = await self._run(self._get_watermark, room_id)
+            if watermark and up_to_ms is not None and watermark[1] >= up_to_ms:
+                return True
+            since = uuid.UUID(watermark[0]) if watermark else min_uuid_from_time(0)
+
+            docs = []
+            newest = None
+            read = 0
+            async for row in iter_messages_after(room_id, since):
+                if limit is not None and read >= limit:
+                    # What was read is indexed; the watermark stays put
+                    await self._run(self._write, docs)
+                    return False
+                read += 1
+                if newest is None:
+                    newest = row
+                if row.content:
+                    docs.append((
+                        str(row.message_id), room_id, team_id,
+                        str(row.sender_id), str(row.receiver_id),
+                        to_millis(row.timestamp), row.content,
+                    ))
+                if len(docs) >= settings.SEARCH_INDEX_BATCH_SIZE:
+                    await self._run(self._write, docs)
+                    docs = []
+
+            if newest is not None:
+                # Rows arrive newest first; the watermark is only stored
+                # once everything below it has been written.
+                await self._run(self._write, docs, (
+                    room_id, str(newest.message_id), to_millis(newest.timestamp)
+                ))
+            return True
+
+    def _schedule_catch_up(self, room_id: str, team_id: str, indexed_only: bool = False):
+        # At most one background catch-up per room
+        if room_id in self._catch_ups or self._conn is None:
+            return
+        task = asyncio.create_task(self._background_catch_up(room_id, team_id, indexed_only))
+        self._catch_ups[room_id] = task
+        task.add_done_callback(lambda _: self._catch_ups.pop(room_id, None))
+
+    async def _background_catch_up(self, room_id: str, team_id: str, indexed_only: bool):
+        try:
+            async with self._catch_up_semaphore:
+                if indexed_only and not await self._run(self._get_watermark, room_id):
+                    # Nobody has searched this room here yet
+                    return
+                await self.catch_up_room(room_id, team_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f'Background catch-up of {room_id} failed')
+
+    async def _catch_up_capped(self, room_id: str, team_id: str, up_to_ms: Optional[int] = None):
+        if not await self.catch_up_room(
+            room_id, team_id, up_to_ms, limit=settings.SEARCH_CATCH_UP_LIMIT
+        ):
+            self._schedule_catch_up(room_id, team_id)
+
+    def _query(self, match: str, filters: str, params: tuple, limit: int, offset: int):
+        return self._conn.execute(
+            f"""
+            SELECT d.message_id, d.room_id, d.sender_id, d.receiver_id,
+                d.ts, d.content, bm25(message_fts) AS score
+            FROM message_fts
+            JOIN message_docs d ON d.id = message_fts.rowid
+            WHERE message_fts MATCH ? AND {filters}
+            ORDER BY score, d.ts DESC
+            LIMIT ? OFFSET ?
+            """,
+            (match, *params, limit, offset),
+        ).fetchall()
+
+    async def search_room(
+        self, team_id: str, room_id: str, text: str, limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        match = build_match_query(text)
+        if match is None:
+            return []
+        await self._catch_up_capped(room_id, team_id)
+        await self.flush()
+        rows = await self._run(
+            self._query, match, 'd.room_id = ?', (room_id,), limit, offset
+        )
+        return [self._to_result(row) for row in rows]
+
+    async def search_user(
+        self, team_id: str, user_id: str, text: str, limit: int, offset: int = 0
+    ) -> List[Dict[str, Any]]:
+        match = build_match_query(text)
+        if match is None:
+            return []
+
+        rooms = await (await execute_async(
+            get_statement('select_user_rooms'), (team_id, user_id)
+        )).all()
+        watermarks = await self._run(self._get_watermarks, [row.room_id for row in rooms])
+        semaphore = asyncio.Semaphore(8)
+
+        async def catch_up(row):
+            activity = room_activity(row)
+            up_to_ms = to_millis(activity) if activity else None
+            if row.room_id not in watermarks:
+                # Never indexed here: backfill off the request path
+                self._schedule_catch_up(row.room_id, team_id)
+                return
+            if up_to_ms is not None and watermarks[row.room_id] >= up_to_ms:
+                return
+            async with semaphore:
+                await self._catch_up_capped(row.room_id, team_id, up_to_ms)
+
+        await asyncio.gather(*(catch_up(row) for row in rooms))
+        await self.flush()
+        rows = await self._run(
+            self._query,
+            match,
+            'd.team_id = ? AND (d.sender_id = ? OR d.receiver_id = ?)',
+            (team_id, user_id, user_id),
+            limit,
+            offset,
+        )
+        return [self._to_result(row) for row in rows]
+
+    @staticmethod
+    def _to_result(row: tuple) -> Dict[str, Any]:
+        message_id, room_id, sender_id, receiver_id, ts, content, score = row
+        return {
+            'message_id': message_id,
+            'room_id': room_id,
+            'sender_id': sender_id,
+            'receiver_id': receiver_id,
+            'content': content,
+            'timestamp': from_millis(ts),
+            'score': -score,
+        }
+
+
+search_index = MessageSearchIndex(settings.SEARCH_INDEX_PATH)
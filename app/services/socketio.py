@@ -1,28 +1,48 @@
-import asyncio
-from datetime import datetime, timezone
 from http.cookies import SimpleCookie
 from fastapi import HTTPException
 
-from app.utils.jwt_utils import decode_jwt
-from app.utils.auth import verify_cookies
+from app.utils.auth import _normalize_cookies, verify_cookies
 from app.utils.logger import get_logger
 
 from app.sio_server import sio
 from app.services.chat import (
     create_or_get_chat_room,
+    get_room_team_id,
     get_user_rooms,
     handle_direct_text_message,
 )
+from app.services.connections import (
+    add_connection,
+    get_connection,
+    remove_connection,
+    user_room,
+)
+from app.services.ephemeral import clear_user_activity, handle_activity
+from app.services.groups import (
+    get_group,
+    get_user_groups,
+    group_room,
+    mark_group_read as mark_group_messages_read,
+    send_group_message as send_to_group,
+)
+from app.services.membership import get_room_participant
+from app.services.presence import presence_room, user_connected, user_disconnected
+from app.services.rate_limit import rate_limited
+from app.services.room_cache import known_rooms
+from app.services.sync import sync_changes
+from app.services.receipts import mark_read as mark_messages_read, mark_room_read
 
-from app.db.cassandra import get_cassandra_session
 from app.schemas.data_validators import (
+    GroupValidator,
+    JoinGroupsValidator,
+    MarkReadValidator,
+    SendGroupMessageValidator,
     StartChatValidator, 
-    SendChatMessageValidator
+    SendChatMessageValidator,
+    SyncValidator,
 )
 
 logger = get_logger('socketio')
-connected_cookies = {}
-session = get_cassandra_session()
 
 @sio.event
 async def connect(sid, environ):
@@ -30,7 +50,7 @@ async def connect(sid, environ):
     cookies.load(environ.get('HTTP_COOKIE', ''))
 
     try:
-        await verify_cookies(cookies)
+        decoded = await verify_cookies(cookies)
     except HTTPException:
         await sio.emit(
             'auth_failed', 
@@ -46,7 +66,6 @@ async def connect(sid, environ):
         await sio.disconnect(sid)
         return
 
-    decoded = decode_jwt(token.value)
     if not decoded:
         await sio.emit('auth_failed', {'message': 'Invalid token'}, room=sid)
         await sio.disconnect(sid)
@@ -58,29 +77,32 @@ async def connect(sid, environ):
         await sio.disconnect(sid)
         return
 
-    connected_cookies[sid] = cookies
-    await sio.save_session(sid, {'user_id': str(user_id)})
+    add_connection(sid, str(user_id), _normalize_cookies(cookies))
+    sio.enter_room(sid, user_room(str(user_id)))
+    await user_connected(str(user_id), sid)
     logger.info(f'Client {sid} connected')
 
 
 @sio.event
+@rate_limited('start_chat')
 async def start_chat(sid, data):
     try:
-        sio_session = await sio.get_session(sid)
-        user_id = sio_session.get('user_id') if sio_session else None
-
-        if not user_id:
+        context = get_connection(sid)
+        if context is None:
             await sio.emit('auth_failed', {
                 'message': 'Unauthorized',
                 'code': 401
             }, room=sid)
             return
+        context.events += 1
+        user_id = context.user_id
         
         validated_data = StartChatValidator(**data)
         team_id = validated_data.team_id
         receiver_id = validated_data.receiver_id
         
-        cookies = connected_cookies.get(sid, {})
+        context.add_team(team_id)
+        cookies = context.cookies
         room_id = await create_or_get_chat_room(
             team_id,
             user_id, 
@@ -88,6 +110,7 @@ async def start_chat(sid, data):
             cookies,
         )
         sio.enter_room(sid, room_id)
+        sio.enter_room(sid, presence_room(receiver_id))
 
         room_details = await get_user_rooms(
             team_id=team_id,
@@ -95,18 +118,25 @@ async def start_chat(sid, data):
             cookies=cookies,
             room_id=room_id,
         )
+        if not room_details:
+            # Remembered as known but its mappings are missing; forget it
+            # so creation runs again and repairs the room.
+            await known_rooms.forget(team_id, room_id)
+            await create_or_get_chat_room(team_id, user_id, receiver_id, cookies)
+            room_details = await get_user_rooms(
+                team_id=team_id,
+                user_id=user_id,
+                cookies=cookies,
+                room_id=room_id,
+            )
+            if not room_details:
+                raise ValueError(f'Could not open chat room {room_id}')
         await sio.emit('chat_room', {
             'status': 'success',
             'data': room_details[0],
         }, room=sid)
 
-        await asyncio.to_thread(session.execute,
-            """
-            UPDATE user_chats_by_user
-            SET last_read = %s
-            WHERE user_id = %s AND room_id = %s AND team_id = %s
-            """, (datetime.now(timezone.utc), user_id, room_id, team_id)
-        )
+        await mark_room_read(team_id, user_id, room_id)
     except ValueError as ve:
         logger.exception('Error 400 starting chat:', ve)
         await sio.emit('error', {
@@ -122,28 +152,40 @@ async def start_chat(sid, data):
         }, room=sid)
 
 @sio.event
+@rate_limited('send_direct_message')
 async def send_direct_message(sid, data):
     try:
-        sio_session = await sio.get_session(sid)
-        user_id = sio_session.get('user_id') if sio_session else None
-
-        if not user_id:
+        context = get_connection(sid)
+        if context is None:
             await sio.emit('auth_failed', {
                 'message': 'Unauthorized',
                 'code': 401
             }, room=sid)
             return
+        context.events += 1
+        user_id = context.user_id
         
         validated_data = SendChatMessageValidator(**data)
         room_id = validated_data.room_id
         message_type = validated_data.message_type
 
+        participant_id = await get_room_participant(
+            get_room_team_id(room_id), user_id, room_id
+        )
+        if participant_id is None or participant_id != validated_data.receiver_id:
+            await sio.emit('error', {
+                'message': 'Not a member of this room',
+                'code': 403
+            }, room=sid)
+            return
+
         if message_type == 'text':
             message_data = await handle_direct_text_message(user_id, validated_data)
         else:
             # handle messages containing file
             message_data = {} # To be implemented
 
+        context.messages_sent += 1
         await sio.emit(
             'new_message',
             message_data,
@@ -159,7 +201,194 @@ async def send_direct_message(sid, data):
         logger.exception(f'Error 500 sending message: {e}')
         await sio.emit('error', {'message': 'Failed to send message.'}, to=sid)
 
+@sio.event
+@rate_limited('mark_read')
+async def mark_read(sid, data):
+    try:
+        context = get_connection(sid)
+        if context is None:
+            await sio.emit('auth_failed', {
+                'message': 'Unauthorized',
+                'code': 401
+            }, room=sid)
+            return
+        context.events += 1
+
+        validated_data = MarkReadValidator(**data)
+        room_id = validated_data.room_id
+        team_id = get_room_team_id(room_id)
+        if await get_room_participant(team_id, context.user_id, room_id) is None:
+            await sio.emit('error', {
+                'message': 'Not a member of this room',
+                'code': 403
+            }, room=sid)
+            return
+
+        await mark_messages_read(
+            team_id, context.user_id, room_id, validated_data.message_id
+        )
+    except ValueError as ve:
+        logger.exception(f'Error 400 marking read: {ve}')
+        await sio.emit('error', {
+            'message': str(ve),
+            'code': 400
+        }, room=sid)
+    except Exception as e:
+        logger.exception(f'Error 500 marking read: {e}')
+        await sio.emit('error', {'message': 'Failed to mark as read.'}, to=sid)
+
+@sio.event
+@rate_limited('sync')
+async def sync(sid, data):
+    try:
+        context = get_connection(sid)
+        if context is None:
+            await sio.emit('auth_failed', {
+                'message': 'Unauthorized',
+                'code': 401
+            }, room=sid)
+            return
+        context.events += 1
+
+        validated_data = SyncValidator(**data)
+        async for chunk in sync_changes(
+            validated_data.team_id,
+            context.user_id,
+            context.cookies,
+            validated_data.since,
+            validated_data.rooms,
+        ):
+            await sio.emit('sync_chunk', chunk, room=sid)
+    except ValueError as ve:
+        logger.exception(f'Error 400 syncing: {ve}')
+        await sio.emit('error', {
+            'message': str(ve),
+            'code': 400
+        }, room=sid)
+    except Exception as e:
+        logger.exception(f'Error 500 syncing: {e}')
+        await sio.emit('error', {'message': 'Failed to sync.'}, to=sid)
+
+@sio.event
+@rate_limited('join_groups')
+async def join_groups(sid, data):
+    try:
+        context = get_connection(sid)
+        if context is None:
+            await sio.emit('auth_failed', {
+                'message': 'Unauthorized',
+                'code': 401
+            }, room=sid)
+            return
+        context.events += 1
+
+        validated_data = JoinGroupsValidator(**data)
+        context.add_team(validated_data.team_id)
+        groups = await get_user_groups(validated_data.team_id, context.user_id)
+        for group in groups:
+            sio.enter_room(sid, group_room(group['group_id']))
+
+        await sio.emit('groups', {
+            'status': 'success',
+            'data': groups,
+        }, room=sid)
+    except ValueError as ve:
+        logger.exception(f'Error 400 joining groups: {ve}')
+        await sio.emit('error', {
+            'message': str(ve),
+            'code': 400
+        }, room=sid)
+    except Exception as e:
+        logger.exception(f'Error 500 joining groups: {e}')
+        await sio.emit('error', {'message': 'Failed to join groups.'}, to=sid)
+
+@sio.event
+@rate_limited('send_group_message')
+async def send_group_message(sid, data):
+    try:
+        context = get_connection(sid)
+        if context is None:
+            await sio.emit('auth_failed', {
+                'message': 'Unauthorized',
+                'code': 401
+            }, room=sid)
+            return
+        context.events += 1
+
+        validated_data = SendGroupMessageValidator(**data)
+        group = await get_group(validated_data.group_id)
+        if group is None or context.user_id not in group.members:
+            await sio.emit('error', {
+                'message': 'Not a member of this group',
+                'code': 403
+            }, room=sid)
+            return
+
+        message_data = await send_to_group(
+            group, context.user_id, validated_data.content, validated_data.message_type
+        )
+        context.messages_sent += 1
+        # One emit for the whole group; member rows are updated write-behind
+        await sio.emit(
+            'new_group_message',
+            message_data,
+            room=group_room(group.group_id),
+        )
+    except ValueError as ve:
+        logger.exception(f'Error 400 sending group message: {ve}')
+        await sio.emit('error', {
+            'message': str(ve),
+            'code': 400
+        }, room=sid)
+    except Exception as e:
+        logger.exception(f'Error 500 sending group message: {e}')
+        await sio.emit('error', {'message': 'Failed to send message.'}, to=sid)
+
+@sio.event
+@rate_limited('mark_group_read')
+async def mark_group_read(sid, data):
+    try:
+        context = get_connection(sid)
+        if context is None:
+            await sio.emit('auth_failed', {
+                'message': 'Unauthorized',
+                'code': 401
+            }, room=sid)
+            return
+        context.events += 1
+
+        validated_data = GroupValidator(**data)
+        group = await get_group(validated_data.group_id)
+        if group is None or context.user_id not in group.members:
+            await sio.emit('error', {
+                'message': 'Not a member of this group',
+                'code': 403
+            }, room=sid)
+            return
+
+        await mark_group_messages_read(group, context.user_id)
+    except ValueError as ve:
+        logger.exception(f'Error 400 marking group read: {ve}')
+        await sio.emit('error', {
+            'message': str(ve),
+            'code': 400
+        }, room=sid)
+    except Exception as e:
+        logger.exception(f'Error 500 marking group read: {e}')
+        await sio.emit('error', {'message': 'Failed to mark as read.'}, to=sid)
+
+@sio.event
+async def activity(sid, data):
+    # Typing and similar signals; kept off the rate-limited durable path
+    context = get_connection(sid)
+    if context is None:
+        return
+    await handle_activity(sid, context, data)
+
 @sio.event
 async def disconnect(sid):
-    connected_cookies.pop(sid, None)
+    context = remove_connection(sid)
+    if context is not None:
+        await user_disconnected(context.user_id, sid)
+        await clear_user_activity(context.user_id)
     logger.info(f'Client disconnected: {sid}')
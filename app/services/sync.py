@@ -0,0 +1,101 @@
+import asyncio
+import uuid
+from typing import Any, AsyncIterator, Dict, Optional
+
+from cassandra.util import min_uuid_from_time, unix_time_from_uuid1
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.statements import get_statement
+from app.services.chat import _build_rooms
+from app.services.direct_messages import get_messages_after
+from app.services.inbox import from_millis, get_rooms_for_entries, to_millis
+from app.utils.logger import get_logger
+
+logger = get_logger('sync')
+
+
+def _parse_cursors(rooms: Dict[str, str]) -> Dict[str, uuid.UUID]:
+    try:
+        return {room_id: uuid.UUID(message_id) for room_id, message_id in rooms.items()}
+    except ValueError:
+        raise ValueError('Invalid message_id cursor')
+
+
+async def _room_messages(room_id: str, after: uuid.UUID) -> Dict[str, Any]:
+    # Newest first off the clustering order, so only the newest
+    # SYNC_MAX_MESSAGES_PER_ROOM are read; older ones are left to paging.
+    limit = settings.SYNC_MAX_MESSAGES_PER_ROOM
+    rows = await get_messages_after(room_id, after, limit + 1)
+    truncated = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'type': 'messages',
+        'room_id': room_id,
+        'messages': [
+            {
+                'message_id': row.message_id,
+                'sender_id': row.sender_id,
+                'content': row.content,
+                'timestamp': row.timestamp,
+            }
+            for row in reversed(rows)
+        ],
+        # Older missed messages exist; page back from the first one
+        'truncated': truncated,
+    }
+
+
+async def sync_changes(
+    team_id: str,
+    user_id: str,
+    cookies: dict,
+    since: Optional[int] = None,
+    rooms: Optional[Dict[str, str]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield what changed for a user since the client's cursors.
+
+    Changed rooms come from the recency-ordered inbox index, so the cost
+    follows what was missed. Chunks are {'type': 'rooms'}, one
+    {'type': 'messages'} per changed room and a final {'type': 'done'}
+    carrying the next global watermark. Messages in the watermark's own
+    millisecond can be repeated; clients dedupe by message_id.
+    """
+    cursors = _parse_cursors(rooms or {})
+    if since is None:
+        since = min(int(unix_time_from_uuid1(message_id) * 1000) for message_id in cursors.values())
+
+    entries = (await execute_async(
+        get_statement('select_inbox_since'),
+        (team_id, user_id, from_millis(since), settings.SYNC_MAX_ROOMS + 1)
+    )).current_rows
+    if len(entries) > settings.SYNC_MAX_ROOMS:
+        # Too far behind for a delta to be cheaper than a full reload
+        yield {'type': 'done', 'full_resync': True, 'watermark': None}
+        return
+
+    # Racing updates can leave more than one entry per room; newest wins
+    latest = {}
+    for entry in entries:
+        latest.setdefault(entry.room_id, entry)
+    entries = list(latest.values())
+
+    watermark = since
+    chunk_size = settings.SYNC_ROOMS_CHUNK_SIZE
+    for start in range(0, len(entries), chunk_size):
+        chunk = entries[start:start + chunk_size]
+        rows = await get_rooms_for_entries(team_id, user_id, chunk)
+        if rows:
+            yield {'type': 'rooms', 'rooms': await _build_rooms(team_id, user_id, cookies, rows)}
+
+        since_id = min_uuid_from_time(since / 1000)
+        results = await asyncio.gather(*(
+            _room_messages(entry.room_id, cursors.get(entry.room_id, since_id))
+            for entry in chunk
+        ))
+        for entry, result in zip(chunk, results):
+            watermark = max(watermark, to_millis(entry.last_message_timestamp))
+            if result['messages']:
+                yield result
+
+    yield {'type': 'done', 'full_resync': False, 'watermark': watermark}
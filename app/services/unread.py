@@ -0,0 +1,177 @@
+import asyncio
+import calendar
+import random
+import uuid
+from datetime import datetime
+from typing import Dict, Set
+
+from cassandra.util import min_uuid_from_time
+from redis.exceptions import RedisError
+
+from app.config.settings import settings
+from app.db.async_cassandra import execute_async
+from app.db.redis import get_redis
+from app.db.statements import get_statement
+from app.services.direct_messages import count_messages_after
+from app.utils.logger import get_logger
+
+logger = get_logger('unread')
+
+# Marks a counter hash that has been fully built, so an empty hash can be
+# told apart from one that was never built (or was evicted).
+_BUILT_FIELD = '__built'
+# Rooms whose counter may be wrong, recounted by the reconciler: a missed
+# increment, a read position behind the newest message, or a sample.
+_DIRTY_KEY = 'unread:dirty'
+
+# Increments lost while Redis was down, queued once it is back
+_missed: Set[str] = set()
+
+
+def _counts_key(team_id: str, user_id: str) -> str:
+    return f'unread:{team_id}:{user_id}'
+
+
+# 100ns intervals between the UUID epoch (1582-10-15) and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def read_watermark(last_read: datetime) -> uuid.UUID:
+    """The greatest timeuuid in last_read's millisecond.
+
+    last_read is stored with millisecond precision, truncating the time of
+    the message that was read, so everything up to the end of that
+    millisecond counts as read. Clock sequence and node are the largest
+    values under Cassandra's signed byte comparison, as in
+    max_uuid_from_time.
+    """
+    ms = calendar.timegm(last_read.utctimetuple()) * 1000 + last_read.microsecond // 1000
+    ticks = (ms + 1) * 10_000 - 1 + _UUID_EPOCH_OFFSET
+    return uuid.UUID(fields=(
+        ticks & 0xFFFFFFFF,
+        (ticks >> 32) & 0xFFFF,
+        ((ticks >> 48) & 0x0FFF) | 0x1000,
+        0xBF,
+        0x7F,
+        0x7F7F7F7F7F7F,
+    ))
+
+
+async def count_unread_messages(team_id: str, room_id: str, user_id: str) -> int:
+    # Exact count from Cassandra. Only used to (re)build counters.
+    last_read = (await execute_async(
+        get_statement('select_last_read'), (team_id, room_id, user_id)
+    )).one()
+
+    if not last_read or not last_read.last_read:
+        last_read_uuid = min_uuid_from_time(0)
+    else:
+        last_read_uuid = read_watermark(last_read.last_read)
+
+    return await count_messages_after(room_id, last_read_uuid)
+
+
+async def increment_unread(team_id: str, user_id: str, room_id: str):
+    member = f'{team_id}:{user_id}:{room_id}'
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.hincrby(_counts_key(team_id, user_id), room_id, 1)
+            if random.random() < settings.UNREAD_RECONCILE_SAMPLE_RATE:
+                pipe.sadd(_DIRTY_KEY, member)
+            await pipe.execute()
+    except RedisError as e:
+        # The reconciler will pick this up once Redis is back
+        logger.warning(f'Could not increment unread counter: {e}')
+        _missed.add(member)
+
+
+async def reset_unread(team_id: str, user_id: str, room_id: str):
+    try:
+        await get_redis().hset(_counts_key(team_id, user_id), room_id, 0)
+    except RedisError as e:
+        logger.warning(f'Could not reset unread counter: {e}')
+
+
+async def queue_unread_recount(team_id: str, user_id: str, room_id: str):
+    # Only call once the read position it should count from is stored
+    try:
+        await get_redis().sadd(_DIRTY_KEY, f'{team_id}:{user_id}:{room_id}')
+    except RedisError as e:
+        logger.warning(f'Could not queue unread recount: {e}')
+
+
+async def get_unread_counts(team_id: str, user_id: str) -> Dict[str, int]:
+    try:
+        counts = await get_redis().hgetall(_counts_key(team_id, user_id))
+    except RedisError as e:
+        logger.warning(f'Unread counters unavailable, counting from Cassandra: {e}')
+        return await _count_all_rooms(team_id, user_id)
+
+    if _BUILT_FIELD not in counts:
+        return await reconcile_unread_counts(team_id, user_id)
+
+    counts.pop(_BUILT_FIELD)
+    return {room_id: max(int(count), 0) for room_id, count in counts.items()}
+
+
+async def _count_all_rooms(team_id: str, user_id: str) -> Dict[str, int]:
+    rows = await (await execute_async(
+        get_statement('select_user_rooms'), (team_id, user_id)
+    )).all()
+    counts = await asyncio.gather(
+        *(count_unread_messages(team_id, row.room_id, user_id) for row in rows)
+    )
+    return {row.room_id: count for row, count in zip(rows, counts)}
+
+
+async def reconcile_unread_counts(team_id: str, user_id: str) -> Dict[str, int]:
+    counts = await _count_all_rooms(team_id, user_id)
+    key = _counts_key(team_id, user_id)
+    try:
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={_BUILT_FIELD: 1, **counts})
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f'Could not store reconciled unread counters: {e}')
+    return counts
+
+
+async def reconcile_room_unread_count(team_id: str, user_id: str, room_id: str) -> int:
+    count = await count_unread_messages(team_id, room_id, user_id)
+    try:
+        await get_redis().hset(_counts_key(team_id, user_id), room_id, count)
+    except RedisError as e:
+        logger.warning(f'Could not store reconciled unread counter: {e}')
+    return count
+
+
+async def _reconcile_member(member: str, semaphore: asyncio.Semaphore):
+    team_id, user_id, room_id = member.split(':', 2)
+    async with semaphore:
+        try:
+            await reconcile_room_unread_count(team_id, user_id, room_id)
+        except Exception:
+            logger.exception(f'Failed to reconcile unread counts for {member}')
+
+
+async def run_unread_reconciler():
+    # Periodically recount the rooms whose counters may have drifted
+    while True:
+        await asyncio.sleep(settings.UNREAD_RECONCILE_INTERVAL)
+        try:
+            if _missed:
+                missed = list(_missed)
+                await get_redis().sadd(_DIRTY_KEY, *missed)
+                _missed.difference_update(missed)
+            members = await get_redis().spop(
+                _DIRTY_KEY, settings.UNREAD_RECONCILE_BATCH
+            )
+        except RedisError as e:
+            logger.warning(f'Unread reconciler could not read dirty set: {e}')
+            continue
+
+        semaphore = asyncio.Semaphore(settings.UNREAD_RECONCILE_CONCURRENCY)
+        await asyncio.gather(*(
+            _reconcile_member(member, semaphore) for member in members or []
+        ))
@@ -1,11 +1,170 @@
-import aiohttp
+import asyncio
+import json
+from typing import Any, Dict, Iterable, List, Optional
+
+from redis.exceptions import RedisError
 
 from app.config.settings import settings
-        
+from app.db.redis import get_redis
+from app.utils.auth import _normalize_cookies
+from app.utils.cache import TTLCache
+from app.utils.http_client import get_backend_client
+from app.utils.logger import get_logger
+
+logger = get_logger('user')
+
 async def fetch_member_info(team_id, user_id, cookies):
-    url = f'{settings.BACKEND_BASE_URL}/teams/{team_id}/members?user_id={user_id}'
-    async with aiohttp.ClientSession(cookies=cookies) as session:
-        async with session.get(url, cookies=cookies) as response:
-            if response.status == 200:
-                return await response.json()
-            return None
+    status_code, body = await get_backend_client().get(
+        f'/teams/{team_id}/members',
+        params={'user_id': user_id},
+        cookies=_normalize_cookies(cookies),
+    )
+    if status_code == 200:
+        return body
+    return None
+
+
+async def fetch_members_info(team_id, user_ids: List[str], cookies) -> Dict[str, Dict[str, Any]]:
+    """Resolve several members of a team with a single backend request.
+
+    Members missing from the response (or returned without a user_id) are
+    looked up one by one. `id` is the membership row's own key, never the
+    user's, so it is not used for matching.
+    """
+    status_code, body = await get_backend_client().get(
+        f'/teams/{team_id}/members',
+        params={settings.BACKEND_MEMBERS_BATCH_PARAM: ','.join(user_ids)},
+        cookies=_normalize_cookies(cookies),
+    )
+
+    members = {}
+    if status_code == 200 and isinstance(body, list):
+        for member in body:
+            member_id = member.get('user_id')
+            if member_id is not None:
+                members[str(member_id)] = member
+
+    missing = [uid for uid in user_ids if uid not in members]
+    if missing:
+        results = await asyncio.gather(
+            *(fetch_member_info(team_id, uid, cookies) for uid in missing)
+        )
+        for uid, result in zip(missing, results):
+            if result and isinstance(result, list):
+                members[uid] = result[0]
+    return members
+
+
+class MemberInfoCache:
+    def __init__(self):
+        self.local = TTLCache(
+            maxsize=settings.MEMBER_CACHE_MAXSIZE,
+            ttl=settings.MEMBER_CACHE_TTL,
+        )
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+
+    @staticmethod
+    def _redis_key(team_id: str, user_id: str) -> str:
+        return f'member:{team_id}:{user_id}'
+
+    async def get(self, team_id: str, user_id: str, cookies) -> Optional[Dict[str, Any]]:
+        members = await self.get_many(team_id, [user_id], cookies)
+        return members.get(str(user_id))
+
+    async def get_many(
+        self,
+        team_id: str,
+        user_ids: Iterable[str],
+        cookies,
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        result = {}
+        waiters = {}
+        to_load = []
+        loop = asyncio.get_running_loop()
+
+        for uid in dict.fromkeys(str(u) for u in user_ids):
+            key = (team_id, uid)
+            member = self.local.get(key)
+            if member is not None:
+                result[uid] = member
+            elif key in self._inflight:
+                waiters[uid] = self._inflight[key]
+            else:
+                future = loop.create_future()
+                self._inflight[key] = future
+                waiters[uid] = future
+                to_load.append(uid)
+
+        if to_load:
+            try:
+                loaded = await self._load(team_id, to_load, cookies)
+            except BaseException as e:
+                for uid in to_load:
+                    future = self._inflight.pop((team_id, uid))
+                    if isinstance(e, Exception):
+                        future.set_exception(e)
+                        future.exception()  # re-raised below; don't log as unretrieved
+                    else:
+                        future.cancel()
+                raise
+            for uid in to_load:
+                self._inflight.pop((team_id, uid)).set_result(loaded.get(uid))
+
+        for uid, future in waiters.items():
+            result[uid] = await asyncio.shield(future)
+        return result
+
+    async def _load(self, team_id: str, user_ids: List[str], cookies) -> Dict[str, Dict[str, Any]]:
+        found = {}
+
+        if settings.MEMBER_CACHE_REDIS:
+            try:
+                values = await get_redis().mget(
+                    [self._redis_key(team_id, uid) for uid in user_ids]
+                )
+                for uid, value in zip(user_ids, values):
+                    if value:
+                        found[uid] = json.loads(value)
+            except RedisError as e:
+                logger.warning(f'Member cache redis read failed: {e}')
+
+        missing = [uid for uid in user_ids if uid not in found]
+        if len(missing) == 1:
+            resp = await fetch_member_info(team_id, missing[0], cookies)
+            fetched = {missing[0]: resp[0]} if resp and isinstance(resp, list) else {}
+        elif missing:
+            fetched = await fetch_members_info(team_id, missing, cookies)
+        else:
+            fetched = {}
+
+        if fetched and settings.MEMBER_CACHE_REDIS:
+            try:
+                async with get_redis().pipeline(transaction=False) as pipe:
+                    for uid, member in fetched.items():
+                        pipe.set(
+                            self._redis_key(team_id, uid),
+                            json.dumps(member),
+                            ex=settings.MEMBER_CACHE_REDIS_TTL,
+                        )
+                    await pipe.execute()
+            except RedisError as e:
+                logger.warning(f'Member cache redis write failed: {e}')
+
+        found.update(fetched)
+        for uid, member in found.items():
+            self.local.set((team_id, uid), member)
+        return found
+
+    def invalidate(self, team_id: str, user_id: str):
+        self.local.pop((team_id, str(user_id)))
+
+
+member_cache = MemberInfoCache()
+
+
+async def get_member_info(team_id, user_id, cookies) -> Optional[Dict[str, Any]]:
+    return await member_cache.get(team_id, user_id, cookies)
+
+
+async def get_members_info(team_id, user_ids, cookies) -> Dict[str, Optional[Dict[str, Any]]]:
+    return await member_cache.get_many(team_id, user_ids, cookies)
@@ -0,0 +1,137 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from app.utils.logger import get_logger
+
+logger = get_logger('write_behind')
+
+_writers: List['CoalescingWriter'] = []
+
+
+class CoalescingWriter:
+    """Buffers writes per key and flushes only the latest value.
+
+    Values submitted for a key that is already pending replace it, or are
+    combined with `merge(old, new)` when given. Everything pending is
+    flushed every `window` seconds and on close().
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[Hashable, Any], Awaitable[None]],
+        window: float,
+        merge: Optional[Callable[[Any, Any], Any]] = None,
+        concurrency: int = 32,
+        max_attempts: int = 3,
+    ):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.window = window
+        self.merge = merge
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._pending: Dict[Hashable, Any] = {}
+        self._attempts: Dict[Hashable, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+        self.metrics = {
+            'submitted': 0,
+            'coalesced': 0,
+            'flushed': 0,
+            'failed': 0,
+            'dropped': 0,
+        }
+        _writers.append(self)
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def is_pending(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    def submit(self, key: Hashable, value: Any):
+        self.metrics['submitted'] += 1
+        if key in self._pending:
+            self.metrics['coalesced'] += 1
+            if self.merge is not None:
+                value = self.merge(self._pending[key], value)
+        self._pending[key] = value
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task is not None:
+            # Holding the lock means the loop isn't mid-flush, so cancelling
+            # it can't drop a batch it has already taken from _pending.
+            async with self._flush_lock:
+                self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.window)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception(f'[{self.name}] flush failed')
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def write(key, value):
+                async with semaphore:
+                    await self.flush_fn(key, value)
+
+            keys = list(batch)
+            results = await asyncio.gather(
+                *(write(key, batch[key]) for key in keys),
+                return_exceptions=True,
+            )
+
+            for key, result in zip(keys, results):
+                if not isinstance(result, BaseException):
+                    self.metrics['flushed'] += 1
+                    self._attempts.pop(key, None)
+                    continue
+
+                self.metrics['failed'] += 1
+                attempts = self._attempts.get(key, 0) + 1
+                if attempts >= self.max_attempts:
+                    self.metrics['dropped'] += 1
+                    self._attempts.pop(key, None)
+                    logger.error(f'[{self.name}] dropping write for {key}: {result!r}')
+                    continue
+
+                self._attempts[key] = attempts
+                if key in self._pending:
+                    # A newer value arrived meanwhile; fold the failed one in
+                    if self.merge is not None:
+                        self._pending[key] = self.merge(batch[key], self._pending[key])
+                else:
+                    self._pending[key] = batch[key]
+
+
+def get_write_behind_metrics() -> Dict[str, Dict[str, int]]:
+    return {
+        writer.name: {**writer.metrics, 'pending': writer.pending}
+        for writer in _writers
+    }
+
+
+def start_writers():
+    for writer in _writers:
+        writer.start()
+
+
+async def close_writers():
+    for writer in _writers:
+        await writer.close()
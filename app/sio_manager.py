@@ -0,0 +1,143 @@
+import asyncio
+import pickle
+from typing import List, Optional, Set
+
+from redis.exceptions import RedisError
+from socketio import AsyncRedisManager
+
+from app.utils.logger import get_logger
+from app.utils.node import NODE_ID
+
+logger = get_logger('sio_manager')
+
+
+def room_users(room: str) -> Optional[List[str]]:
+    # Users whose sockets can be in `room`, for the rooms we can resolve
+    if room.startswith('room_'):
+        parts = room.split('_')
+        if len(parts) == 4:
+            return parts[2:]
+    elif room.startswith('user:'):
+        return [room[len('user:'):]]
+    return None
+
+
+class NodeRoutingRedisManager(AsyncRedisManager):
+    """AsyncRedisManager that only publishes to nodes holding recipients.
+
+    Each node also listens on its own channel, `{channel}:{node_id}`. An
+    emit to a room whose users are known (direct rooms, user rooms) is
+    delivered locally if the room has local members and published only to
+    the other nodes where those users have live sockets, looked up in the
+    presence registry. Anything else falls back to the broadcast channel.
+    """
+
+    name = 'noderouting'
+
+    def __init__(self, url, channel='socketio', **kwargs):
+        super().__init__(url, channel=channel, **kwargs)
+        self.host_id = NODE_ID
+        self.metrics = {'local': 0, 'routed': 0, 'published': 0, 'broadcast': 0}
+
+    def node_channel(self, node_id: str) -> str:
+        return f'{self.channel}:{node_id}'
+
+    async def _resolve_nodes(self, namespace: str, room) -> Optional[Set[str]]:
+        if room is None or not isinstance(room, str):
+            return None
+        if self.is_connected(room, namespace):
+            # A socket's own room only exists on the node it's connected to
+            return {self.host_id}
+        users = room_users(room)
+        if users is None:
+            return None
+        # Imported here: the presence service itself emits through sio
+        from app.services.presence import get_user_nodes
+        try:
+            return await get_user_nodes(users)
+        except RedisError as e:
+            logger.warning(f'Falling back to broadcast for {room}: {e}')
+            return None
+
+    async def emit(self, event, data, namespace=None, room=None, skip_sid=None,
+                   callback=None, **kwargs):
+        if kwargs.get('ignore_queue') or callback is not None:
+            return await super().emit(
+                event, data, namespace=namespace, room=room,
+                skip_sid=skip_sid, callback=callback, **kwargs
+            )
+
+        namespace = namespace or '/'
+        nodes = await self._resolve_nodes(namespace, room)
+        if nodes is None:
+            self.metrics['broadcast'] += 1
+            return await super().emit(
+                event, data, namespace=namespace, room=room, skip_sid=skip_sid
+            )
+
+        self.metrics['routed'] += 1
+        if room in self.rooms.get(namespace, {}):
+            self.metrics['local'] += 1
+            await super().emit(
+                event, data, namespace=namespace, room=room,
+                skip_sid=skip_sid, ignore_queue=True
+            )
+
+        remote = nodes - {self.host_id}
+        if remote:
+            message = {
+                'method': 'emit', 'event': event, 'data': data,
+                'namespace': namespace, 'room': room,
+                'skip_sid': skip_sid, 'callback': None,
+                'host_id': self.host_id,
+            }
+            self.metrics['published'] += len(remote)
+            await asyncio.gather(*(
+                self._publish_to(self.node_channel(node), message)
+                for node in remote
+            ))
+
+    async def _publish_to(self, channel: str, data):
+        try:
+            await self.redis.publish(channel, pickle.dumps(data))
+        except RedisError:
+            self._get_logger().error(f'Cannot publish to {channel}')
+
+    async def _return_callback(self, host_id, sid, namespace, callback_id, *args):
+        # Acks go straight back to the node that asked for them
+        await self._publish_to(self.node_channel(host_id), {
+            'method': 'callback', 'host_id': host_id, 'sid': sid,
+            'namespace': namespace, 'id': callback_id, 'args': args,
+        })
+
+    def _channels(self) -> List[str]:
+        return [self.channel, self.node_channel(self.host_id)]
+
+    async def _redis_listen_with_retries(self):
+        retry_sleep = 1
+        connect = False
+        while True:
+            try:
+                if connect:
+                    self._redis_connect()
+                    await self.pubsub.subscribe(*self._channels())
+                    retry_sleep = 1
+                async for message in self.pubsub.listen():
+                    yield message
+            except RedisError:
+                self._get_logger().error(
+                    f'Cannot receive from redis... retrying in {retry_sleep} secs'
+                )
+                connect = True
+                await asyncio.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+    async def _listen(self):
+        channels = self._channels()
+        encoded = {channel.encode('utf-8') for channel in channels}
+        await self.pubsub.subscribe(*channels)
+        async for message in self._redis_listen_with_retries():
+            if message['channel'] in encoded and \
+                    message['type'] == 'message' and 'data' in message:
+                yield message['data']
+        await self.pubsub.unsubscribe(*channels)
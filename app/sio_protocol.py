@@ -0,0 +1,63 @@
+from typing import Set
+from urllib.parse import parse_qs
+
+from socketio import AsyncServer
+from socketio import packet
+
+from app.utils.serializers import json_module, msgpack_available, packb, unpackb
+
+
+class HybridPacket(packet.Packet):
+    """Socket.IO packet that speaks JSON or msgpack.
+
+    Text frames are the regular JSON protocol. A binary frame that isn't
+    an attachment of a pending binary event is a whole msgpack-encoded
+    packet, as sent by socket.io-msgpack-parser clients.
+    """
+
+    json = json_module
+
+    def decode(self, encoded_packet):
+        if isinstance(encoded_packet, str):
+            return super().decode(encoded_packet)
+        decoded = unpackb(encoded_packet)
+        self.packet_type = decoded['type']
+        self.data = decoded.get('data')
+        self.id = decoded.get('id')
+        self.namespace = decoded['nsp']
+        return 0
+
+    def encode_msgpack(self) -> bytes:
+        return packb(self._to_dict())
+
+
+class ChatServer(AsyncServer):
+    """AsyncServer negotiating the packet serializer per client.
+
+    Clients opt into msgpack by connecting with `?serializer=msgpack`;
+    everyone else keeps the default JSON protocol.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('serializer', HybridPacket)
+        kwargs.setdefault('json', json_module)
+        super().__init__(*args, **kwargs)
+        self.msgpack_clients: Set[str] = set()
+
+    async def _handle_eio_connect(self, eio_sid, environ):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        if 'msgpack' in query.get('serializer', []) and msgpack_available():
+            self.msgpack_clients.add(eio_sid)
+        return await super()._handle_eio_connect(eio_sid, environ)
+
+    async def _handle_eio_disconnect(self, eio_sid):
+        try:
+            return await super()._handle_eio_disconnect(eio_sid)
+        finally:
+            self.msgpack_clients.discard(eio_sid)
+
+    async def _send_packet(self, eio_sid, pkt):
+        if eio_sid in self.msgpack_clients:
+            await self.eio.send(eio_sid, pkt.encode_msgpack())
+        else:
+            await super()._send_packet(eio_sid, pkt)
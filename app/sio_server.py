@@ -1,7 +1,8 @@
-from socketio import AsyncServer
 from socketio import AsyncRedisManager
 
 from app.config.settings import settings
+from app.sio_manager import NodeRoutingRedisManager
+from app.sio_protocol import ChatServer
 from app.utils.logger import get_logger
 
 logger = get_logger('socketio')
@@ -9,8 +10,11 @@ logger = get_logger('socketio')
 origins = settings.CORS_ORIGINS.split(',')
 redis_url = settings.REDIS_URL
 
-manager = AsyncRedisManager(redis_url)
-sio = AsyncServer(
+if settings.SIO_NODE_ROUTING:
+    manager = NodeRoutingRedisManager(redis_url)
+else:
+    manager = AsyncRedisManager(redis_url)
+sio = ChatServer(
     async_mode='asgi',
     cors_allowed_origins=origins,
     client_manager=manager,
@@ -21,6 +25,7 @@ sio = AsyncServer(
         'secure': 'False',
         'samesite': 'lax'
     },
+    transports=[t.strip() for t in settings.SIO_TRANSPORTS.split(',') if t.strip()],
     logger=logger,
     engineio_logger=logger,
 )
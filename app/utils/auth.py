@@ -1,23 +1,91 @@
-from fastapi import HTTPException, status
+import asyncio
+import hashlib
+import time
+
 import aiohttp
+import jwt
+from fastapi import HTTPException, status
 
 from app.config.settings import settings
+from app.utils.cache import TTLCache
+from app.utils.http_client import CircuitOpenError, get_backend_client
+from app.utils.jwt_utils import decode_jwt, verify_jwt
 from app.utils.logger import get_logger
 
 logger = get_logger('socketio')
 
+# sha256(access token) -> [claims, last revocation check]. Entries are
+# stored with the token's remaining lifetime; the default ttl is unused.
+_verified_tokens = TTLCache(
+    maxsize=settings.AUTH_TOKEN_CACHE_MAXSIZE,
+    ttl=300,
+)
+
 def _normalize_cookies(cookies):
     if isinstance(cookies, dict):
         return cookies
     return {k: v.value for k, v in cookies.items()}
 
+async def _backend_verdict(cookies_dict) -> int:
+    # The backend's status for the token; 503 when it can't be reached
+    try:
+        status_code, _ = await get_backend_client().post(
+            '/jwt/verify/',
+            cookies=cookies_dict,
+        )
+    except (CircuitOpenError, aiohttp.ClientError, asyncio.TimeoutError):
+        return status.HTTP_503_SERVICE_UNAVAILABLE
+    return status_code
+
+async def _verify_with_backend(cookies_dict):
+    status_code = await _backend_verdict(cookies_dict)
+    if status_code >= 500:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+    if status_code != 200:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+async def _verify_locally(cookies_dict):
+    token = cookies_dict.get('access')
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+
+    key = hashlib.sha256(token.encode()).hexdigest()
+    entry = _verified_tokens.get(key)
+    now = time.time()
+
+    if entry is None:
+        try:
+            claims = verify_jwt(token)
+        except jwt.InvalidTokenError:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        entry = [claims, now]
+        _verified_tokens.set(key, entry, ttl=claims['exp'] - now)
+        return claims
+
+    claims, checked_at = entry
+    interval = settings.AUTH_REVOCATION_CHECK_INTERVAL
+    if interval > 0 and now - checked_at >= interval:
+        # Claim the check up front so concurrent requests with the same
+        # token don't all hit the backend.
+        entry[1] = now
+        status_code = await _backend_verdict(cookies_dict)
+        # Only a definitive rejection revokes; anything else keeps the
+        # local verdict
+        if status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN):
+            _verified_tokens.pop(key)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+        if status_code != 200:
+            logger.warning(
+                f'Token revocation check inconclusive (status {status_code})'
+            )
+    return claims
+
 async def verify_cookies(cookies):
     cookies_dict = _normalize_cookies(cookies)
 
-    async with aiohttp.ClientSession(cookies=cookies_dict) as http_client:
-        async with http_client.post(
-            f'{settings.BACKEND_BASE_URL}/jwt/verify/',
-            cookies=cookies_dict,
-        ) as response:
-            if response.status != 200:
-                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
+    if settings.AUTH_MODE == 'local':
+        return await _verify_locally(cookies_dict)
+
+    await _verify_with_backend(cookies_dict)
+    token = cookies_dict.get('access')
+    return decode_jwt(token) if token else None
@@ -0,0 +1,25 @@
+import uuid
+from datetime import datetime, timezone
+
+from cassandra.util import unix_time_from_uuid1
+
+# Time buckets for partitioning message tables, as sortable ints:
+# 'month' -> 202610, 'day' -> 20261018.
+
+# Larger than any real bucket, for "newest bucket first" range queries
+MAX_BUCKET = 99_999_999
+
+
+def bucket_of(dt: datetime, unit: str) -> int:
+    if unit == 'month':
+        return dt.year * 100 + dt.month
+    if unit == 'day':
+        return (dt.year * 100 + dt.month) * 100 + dt.day
+    raise ValueError(f'Unknown bucket unit: {unit}')
+
+
+def bucket_of_uuid(message_id: uuid.UUID, unit: str) -> int:
+    return bucket_of(
+        datetime.fromtimestamp(unix_time_from_uuid1(message_id), tz=timezone.utc), unit
+    )
+
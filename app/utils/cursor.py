@@ -0,0 +1,30 @@
+import base64
+import json
+import uuid
+from typing import Any, Dict
+
+
+def encode_cursor(data: Dict[str, Any]) -> str:
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, dict):
+        raise ValueError('Invalid cursor')
+    return data
+
+
+def decode_before_cursor(cursor: str) -> uuid.UUID:
+    before = decode_cursor(cursor).get('before')
+    if not isinstance(before, str):
+        raise ValueError('Invalid cursor')
+    try:
+        return uuid.UUID(before)
+    except ValueError:
+        raise ValueError('Invalid cursor')
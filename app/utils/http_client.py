@@ -0,0 +1,156 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from app.config.settings import settings
+from app.utils.logger import get_logger
+
+logger = get_logger('http_client')
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast once the backend keeps erroring, then lets a single
+    probe request through after `reset_timeout` seconds."""
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def before_request(self):
+        state = self.state
+        if state == 'open' or (state == 'half_open' and self._probing):
+            raise CircuitOpenError('Backend circuit is open')
+        if state == 'half_open':
+            self._probing = True
+
+    def release_probe(self):
+        # The request ended without telling us anything about the backend
+        self._probing = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning('Backend circuit opened after %s failures', self.failures)
+            self.opened_at = time.monotonic()
+
+
+class BackendClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip('/')
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(settings.BACKEND_HTTP_MAX_CONCURRENCY)
+        self.breaker = CircuitBreaker(
+            failure_threshold=settings.BACKEND_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.BACKEND_CIRCUIT_RESET_TIMEOUT,
+        )
+
+    async def start(self):
+        if self._session is not None:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=settings.BACKEND_HTTP_POOL_SIZE,
+            limit_per_host=settings.BACKEND_HTTP_POOL_PER_HOST,
+            keepalive_timeout=settings.BACKEND_HTTP_KEEPALIVE,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=settings.BACKEND_HTTP_TIMEOUT),
+            # Cookies are per-user; never let one request's cookies leak
+            # into the shared session.
+            cookie_jar=aiohttp.DummyCookieJar(),
+        )
+        logger.info('Backend HTTP client started')
+
+    async def close(self):
+        if self._session is None:
+            return
+        await self._session.close()
+        self._session = None
+        logger.info('Backend HTTP client closed')
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        cookies: Optional[Dict[str, str]] = None,
+        **kwargs,
+    ) -> Tuple[int, Any]:
+        if self._session is None:
+            raise RuntimeError('Backend HTTP client is not started')
+
+        self.breaker.before_request()
+        try:
+            async with self._semaphore:
+                async with self._session.request(
+                    method,
+                    f'{self.base_url}{path}',
+                    cookies=cookies,
+                    **kwargs,
+                ) as response:
+                    body = None
+                    if response.status == 200:
+                        body = await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            # ValueError: a 200 whose body isn't valid JSON
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled or otherwise aborted; free the half-open probe slot
+            self.breaker.release_probe()
+            raise
+
+        if response.status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return response.status, body
+
+    async def get(self, path: str, cookies=None, **kwargs) -> Tuple[int, Any]:
+        return await self.request('GET', path, cookies=cookies, **kwargs)
+
+    async def post(self, path: str, cookies=None, **kwargs) -> Tuple[int, Any]:
+        return await self.request('POST', path, cookies=cookies, **kwargs)
+
+
+_client: Optional[BackendClient] = None
+
+
+def get_backend_client() -> BackendClient:
+    global _client
+    if _client is None:
+        _client = BackendClient(settings.BACKEND_BASE_URL)
+    return _client
+
+
+async def start_backend_client():
+    await get_backend_client().start()
+
+
+async def close_backend_client():
+    if _client is not None:
+        await _client.close()
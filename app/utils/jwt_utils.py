@@ -8,3 +8,13 @@ def decode_jwt(token: str):
     except jwt.InvalidTokenError as e:
         print(f'JWT decoding error: {e}')
         return None
+
+def verify_jwt(token: str) -> dict:
+    # Raises jwt.InvalidTokenError on a bad signature, expired token or a
+    # token that is not valid yet (nbf).
+    return jwt.decode(
+        token,
+        settings.SECRET_KEY,
+        algorithms=[settings.TOKEN_HASH_ALGORITHM],
+        options={'require': ['exp']},
+    )
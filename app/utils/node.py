@@ -0,0 +1,7 @@
+import os
+import socket
+import uuid
+
+# Identifies this worker process across the cluster. Random per start, so
+# a restarted worker never inherits state left behind by its predecessor.
+NODE_ID = f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
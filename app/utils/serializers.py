@@ -0,0 +1,61 @@
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any
+
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # the binary socket protocol is optional
+    msgpack = None
+
+
+def _default(obj: Any) -> Any:
+    # Types neither orjson nor msgpack handle natively
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not serializable')
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    # datetimes, dates and UUIDs are encoded natively, with the same
+    # output as isoformat() / str()
+    return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+def dumps(obj: Any, **kwargs) -> str:
+    # kwargs (e.g. separators) are accepted for json-module compatibility;
+    # orjson output is always compact
+    return dumps_bytes(obj).decode('utf-8')
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+# Drop-in for the `json` hook of python-socketio / python-engineio
+json_module = SimpleNamespace(dumps=dumps, loads=loads)
+
+
+def _msgpack_default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    return _default(obj)
+
+
+def msgpack_available() -> bool:
+    return msgpack is not None
+
+
+def packb(obj: Any) -> bytes:
+    return msgpack.packb(obj, default=_msgpack_default)
+
+
+def unpackb(data: bytes) -> Any:
+    return msgpack.unpackb(data)